@@ -15,11 +15,13 @@
 # under the License.
 
 import collections
+import functools
 import re
+import types
 
-from packaging import markers
-from packaging import specifiers
+import packaging.version
 
+from openstack_requirements import intervals
 from openstack_requirements import project
 from openstack_requirements import requirement
 
@@ -28,6 +30,47 @@ PY3_GLOBAL_SPECIFIER_RE = re.compile(
     r'python_version(==|>=|>)[\'"]3\.\d+[\'"]')
 PY3_LOCAL_SPECIFIER_RE = re.compile(
     r'python_version(==|>=|>|<=|<)[\'"]3\.\d+[\'"]')
+BACKPORT_SPECIFIER_RE = re.compile(
+    r'python_version(==|<=|<)[\'"]3\.\d+[\'"]')
+
+
+class _ReqsByFile(dict):
+    """A dict of file name to requirements which reports changes.
+
+    Adding a new file is passed on to the owner so that it can extend its
+    merged view, any other change makes the owner throw that view away.
+    """
+
+    def __init__(self, owner, *args, **kwargs):
+        super(_ReqsByFile, self).__init__(*args, **kwargs)
+        self._owner = owner
+
+    def __setitem__(self, fname, reqs):
+        replacing = fname in self
+        super(_ReqsByFile, self).__setitem__(fname, reqs)
+        if replacing:
+            self._owner.invalidate()
+        else:
+            self._owner._file_added(fname, reqs)
+
+    def _invalidating(name):
+        def method(self, *args, **kwargs):
+            try:
+                return getattr(super(_ReqsByFile, self), name)(
+                    *args, **kwargs)
+            finally:
+                self._owner.invalidate()
+        method.__name__ = name
+        return method
+
+    __delitem__ = _invalidating('__delitem__')
+    __ior__ = _invalidating('__ior__')
+    clear = _invalidating('clear')
+    pop = _invalidating('pop')
+    popitem = _invalidating('popitem')
+    setdefault = _invalidating('setdefault')
+    update = _invalidating('update')
+    del _invalidating
 
 
 class RequirementsList(object):
@@ -37,10 +80,54 @@ class RequirementsList(object):
         self.project = project
         self.failed = False
 
+    @property
+    def reqs_by_file(self):
+        return self._reqs_by_file
+
+    @reqs_by_file.setter
+    def reqs_by_file(self, value):
+        self._reqs_by_file = _ReqsByFile(self, value)
+        self.invalidate()
+
+    def invalidate(self):
+        """Drop the merged views of reqs_by_file.
+
+        This happens automatically when reqs_by_file itself is changed, but
+        has to be called by hand after changing the requirements of one of
+        the files in place.
+        """
+        self._merged = None
+        self._files_by_package = None
+
+    def _file_added(self, fname, reqs):
+        if self._merged is None:
+            return
+        self._merged.update(reqs)
+        for name in reqs:
+            self._files_by_package.setdefault(name, []).append(fname)
+
+    def _build(self):
+        self._merged = {}
+        self._files_by_package = {}
+        for fname, reqs in self._reqs_by_file.items():
+            self._file_added(fname, reqs)
+
     @property
     def reqs(self):
-        return {k: v for d in self.reqs_by_file.values()
-                for k, v in d.items()}
+        """A read-only view of the requirements of all files merged.
+
+        Where a package appears in several files, the entry from the file
+        added last wins.
+        """
+        if self._merged is None:
+            self._build()
+        return types.MappingProxyType(self._merged)
+
+    def files_for(self, name):
+        """Return the names of the files that contain the package name."""
+        if self._files_by_package is None:
+            self._build()
+        return tuple(self._files_by_package.get(name, ()))
 
     def extract_reqs(self, content, strict):
         reqs = collections.defaultdict(set)
@@ -90,94 +177,144 @@ def _get_exclusions(req):
     )
 
 
-def _is_requirement_in_global_reqs(
-    local_req,
-    global_reqs,
-    backports,
-    allow_3_only=False,
-):
-    req_exclusions = _get_exclusions(local_req)
-    for global_req in global_reqs:
+class GlobalRequirementSet(frozenset):
+    """The global requirements entries for a single package.
+
+    This is a frozenset of Requirement objects, with the entries indexed by
+    (package, location, markers) and their exclusions computed up front so
+    that matching a local requirement does not need to scan every entry.
+    """
+
+    __slots__ = ('_by_key', '_by_location', '_py3_only', '_exclusions',
+                 '_allowed')
+
+    def __new__(cls, reqs=()):
+        self = super(GlobalRequirementSet, cls).__new__(cls, reqs)
+        self._by_key = {}
+        self._by_location = {}
+        self._py3_only = {}
+        self._exclusions = {}
+        self._allowed = {}
+        # Sort so that the entry picked when several could match does not
+        # depend on set iteration order.
+        for req in sorted(self, key=_global_req_sort_key):
+            location = (req.package, req.location)
+            self._by_key.setdefault(location + (req.markers,), req)
+            self._by_location.setdefault(location, []).append(req)
+            if PY3_GLOBAL_SPECIFIER_RE.match(req.markers):
+                self._py3_only.setdefault(location, []).append(req)
+            exclusions = frozenset(_get_exclusions(req))
+            self._exclusions[req] = exclusions
+            self._allowed[req] = intervals.from_specifiers(
+                ','.join(sorted(exclusions)))
+        return self
+
+    def exclusions(self, req):
+        """Return the exclusions of the entry req."""
+        return self._exclusions[req]
+
+    def allowed(self, req):
+        """Return the VersionRange left over by the exclusions of req."""
+        return self._allowed[req]
+
+    def find_match(self, local_req, backports, allow_3_only=False):
+        """Return the global entry local_req should be checked against.
+
+        The package and location have to match exactly. The markers have to
+        match as well, except that python 3 only requirements may leave out
+        (or add) a python_version marker when allow_3_only is set, and
+        backport packages may add an upper python_version marker.
+
+        :return: A Requirement, or None if there is no matching entry.
+        """
+        location = (local_req.package, local_req.location)
+        global_req = self._by_key.get(location + (local_req.markers,))
+        if global_req is not None:
+            return global_req
+        if allow_3_only:
+            if not local_req.markers:
+                py3_only = self._py3_only.get(location)
+                if py3_only:
+                    return py3_only[0]
+            elif PY3_LOCAL_SPECIFIER_RE.match(local_req.markers):
+                global_req = self._by_key.get(location + ('',))
+                if global_req is not None:
+                    return global_req
+        # likewise, if a package is one of the backport packages then
+        # we're okay with a potential marker (e.g. if a package
+        # requires a feature that is only available in a newer Python
+        # library, while other packages are happy without this feature
+        if (
+            local_req.package in backports and
+            BACKPORT_SPECIFIER_RE.match(local_req.markers) and
+            location in self._by_location
+        ):
+            print('Ignoring backport package with python_version marker')
+            return self._by_location[location][0]
+        return None
+
+
+def _global_req_sort_key(req):
+    return (req.package, req.location, req.markers, req.specifiers,
+            req.comment, sorted(req.extras))
 
-        matching = True
+
+def _print_mismatches(local_req, global_reqs):
+    for global_req in sorted(global_reqs, key=_global_req_sort_key):
         for aname in ['package', 'location', 'markers']:
             local_req_val = getattr(local_req, aname)
             global_req_val = getattr(global_req, aname)
             if local_req_val != global_req_val:
-                # if a python 3 version is not spefied in only one of
-                # global requirements or local requirements, allow it since
-                # python 3-only is okay
-                if (
-                    allow_3_only and
-                    matching and
-                    aname == 'markers'
-                ):
-                    if (
-                        not local_req_val and
-                        PY3_GLOBAL_SPECIFIER_RE.match(global_req_val)
-                    ):
-                        continue
-                    if (
-                        not global_req_val and
-                        local_req_val and
-                        PY3_LOCAL_SPECIFIER_RE.match(local_req_val)
-                    ):
-                        continue
-
-                # likewise, if a package is one of the backport packages then
-                # we're okay with a potential marker (e.g. if a package
-                # requires a feature that is only available in a newer Python
-                # library, while other packages are happy without this feature
-                if (
-                    matching and
-                    aname == 'markers' and
-                    local_req.package in backports
-                ):
-                    if re.match(
-                        r'python_version(==|<=|<)[\'"]3\.\d+[\'"]',
-                        local_req_val,
-                    ):
-                        print(
-                            'Ignoring backport package with python_version '
-                            'marker'
-                        )
-                        continue
-
                 print(f'WARNING: possible mismatch found for package "{local_req.package}"')  # noqa: E501
                 print(f'   Attribute "{aname}" does not match')
                 print(f'   "{local_req_val}" does not match "{global_req_val}"')  # noqa: E501
                 print(f'   {local_req}')
                 print(f'   {global_req}')
-                matching = False
-        if not matching:
-            continue
 
-        # This matches the right package and other properties, so
-        # ensure that any exclusions are a subset of the global
-        # set.
-        global_exclusions = _get_exclusions(global_req)
-        if req_exclusions.issubset(global_exclusions):
-            return True
-        else:
-            difference = req_exclusions - global_exclusions
-            print(
-                "ERROR: Requirement for package {} "
-                "excludes a version not excluded in the "
-                "global list.\n"
-                "  Local settings : {}\n"
-                "  Global settings: {}\n"
-                "  Unexpected     : {}".format(
-                    local_req.package, req_exclusions, global_exclusions,
-                    difference)
-            )
-            return False
 
+def _is_requirement_in_global_reqs(
+    local_req,
+    global_reqs,
+    backports,
+    allow_3_only=False,
+):
+    if not isinstance(global_reqs, GlobalRequirementSet):
+        global_reqs = GlobalRequirementSet(global_reqs)
+
+    global_req = global_reqs.find_match(local_req, backports, allow_3_only)
+    if global_req is None:
+        _print_mismatches(local_req, global_reqs)
+        print(
+            "ERROR: "
+            "Could not find a global requirements entry to match package {}. "
+            "If the package is already included in the global list, "
+            "the name or platform markers there may not match the local "
+            "settings.".format(local_req.package)
+        )
+        return False
+
+    # This matches the right package and other properties, so
+    # ensure that any exclusions are a subset of the global
+    # set. Compare the versions excluded rather than the text, so
+    # that e.g. '!=1.4.0' matches '!=1.4' and '<3' is covered by '<2'.
+    req_exclusions = _get_exclusions(local_req)
+    global_exclusions = global_reqs.exclusions(global_req)
+    allowed = global_reqs.allowed(global_req)
+    difference = set(
+        spec for spec in req_exclusions
+        if not allowed.issubset(intervals.from_specifiers(spec))
+    )
+    if not difference:
+        return True
     print(
-        "ERROR: "
-        "Could not find a global requirements entry to match package {}. "
-        "If the package is already included in the global list, "
-        "the name or platform markers there may not match the local "
-        "settings.".format(local_req.package)
+        "ERROR: Requirement for package {} "
+        "excludes a version not excluded in the "
+        "global list.\n"
+        "  Local settings : {}\n"
+        "  Global settings: {}\n"
+        "  Unexpected     : {}".format(
+            local_req.package, req_exclusions, set(global_exclusions),
+            difference)
     )
     return False
 
@@ -185,15 +322,15 @@ def _is_requirement_in_global_reqs(
 def get_global_reqs(content):
     """Return global_reqs structure.
 
-    Parse content and return dict mapping names to sets of Requirement
-    objects."
+    Parse content and return dict mapping names to GlobalRequirementSet
+    objects.
 
     """
     global_reqs = {}
     parsed = requirement.parse(content)
     for k, entries in parsed.items():
         # Discard the lines: we don't need them.
-        global_reqs[k] = set(r for (r, line) in entries)
+        global_reqs[k] = GlobalRequirementSet(r for (r, line) in entries)
     return global_reqs
 
 
@@ -204,14 +341,54 @@ def _get_python3_reqs(reqs):
         if not req.markers:
             results.append(req)
         else:
-            req_markers = markers.Marker(req.markers)
-            if req_markers.evaluate({
-                'python_version': MIN_PY_VERSION,
-            }):
+            if _evaluate_marker(
+                    req.markers, _python_environment(MIN_PY_VERSION)):
                 results.append(req)
     return results
 
 
+# Marker work is cached by marker string, so it is proportional to the number
+# of distinct markers rather than the number of requirement lines checked.
+# Environments are passed around as tuples of (name, value) pairs so they
+# can be part of the cache keys.
+
+@functools.lru_cache(maxsize=None)
+def _python_environment(python_version):
+    """Return the marker environment for python_version."""
+    return (('python_version', python_version),)
+
+
+@functools.lru_cache(maxsize=4096)
+def _evaluate_marker(marker, environment):
+    """Evaluate the marker string against environment."""
+    return requirement.parse_marker(marker).evaluate(dict(environment))
+
+
+@functools.lru_cache(maxsize=4096)
+def _marker_environments(marker):
+    """Return environments built from the values compared in marker.
+
+    Each value is taken as the value of the variable it is compared with,
+    except that python_version ranges and lists, such as the compact
+    markers generate-constraints writes, give one environment for each
+    Python version they hold for.
+    """
+    environment = []
+    python_ranges = False
+    for var, op, val in requirement.parse_marker(
+            marker)._markers:  # WARNING: internals
+        if str(var) == 'python_version' and str(op) != '==':
+            python_ranges = True
+        else:
+            environment.append((str(var), str(val)))
+    if not python_ranges:
+        return (tuple(environment),)
+    return tuple(
+        tuple(environment) + (('python_version', version),)
+        for version in sorted(requirement.marker_python_versions(marker),
+                              key=requirement.python_version_key))
+
+
 def _validate_one(
     name,
     reqs,
@@ -313,7 +490,6 @@ def _find_constraint(req, constraints):
     Otherwise return None.
     """
     if req.markers:
-        req_markers = markers.Marker(req.markers)
         for constraint_setting, _ in constraints:
             if constraint_setting.markers == req.markers:
                 return constraint_setting
@@ -330,12 +506,9 @@ def _find_constraint(req, constraints):
             # best way to ensure the constraint and requirements match
             # is to use the same marker string in the corresponding
             # lines.
-            c_markers = markers.Marker(constraint_setting.markers)
-            env = {
-                str(var): str(val)
-                for var, op, val in c_markers._markers  # WARNING: internals
-            }
-            if req_markers.evaluate(env):
+            if any(_evaluate_marker(req.markers, env)
+                   for env in _marker_environments(
+                       constraint_setting.markers)):
                 return constraint_setting
     # Try looking for a constraint without any markers.
     for constraint_setting, _ in constraints:
@@ -380,7 +553,7 @@ def validate_lower_constraints(req_list, constraints, denylist):
                 continue
 
             for req in reqs:
-                spec = specifiers.SpecifierSet(req.specifiers)
+                spec = req.specifier_set
                 # FIXME(dhellmann): This will only find constraints
                 # where the markers match the requirements list
                 # exactly, so we can't do things like use different
@@ -412,18 +585,34 @@ def validate_lower_constraints(req_list, constraints, denylist):
                               name, version, req, fname))
                     failed = True
 
-                min = [
-                    s
-                    for s in req.specifiers.split(',')
-                    if '>' in s
-                ]
-                if not min:
+                # The lowest version the specifiers admit, so '>=1.2,>=1.4'
+                # and '~=1.4' both give 1.4.
+                try:
+                    hull = intervals.from_specifiers(req.specifiers).hull()
+                except ValueError:
+                    # An arbitrary equality such as '===abc', which sets no
+                    # minimum version to compare with.
+                    continue
+                if hull is None or hull.lower is None:
                     # No minimum specified. Ignore this and let some
                     # other validation trap the error.
                     continue
+                expected = hull.lower
+                if not hull.lower_closed:
+                    # As in '>1.0', there is a bound but no lowest version
+                    # for lower-constraints.txt to match.
+                    print('ERROR: Package {!r} has the exclusive minimum '
+                          'version {} in {}, so no lower constraint can '
+                          'match it; use a >= specifier instead'.format(
+                              name, expected, fname))
+                    failed = True
+                    continue
 
-                expected = min[0].lstrip('>=')
-                if version != expected:
+                try:
+                    matches = packaging.version.Version(version) == expected
+                except packaging.version.InvalidVersion:
+                    matches = False
+                if not matches:
                     print('ERROR: Package {!r} is constrained to {} '
                           'which does not match '
                           'the minimum version specifier {} in {}'.format(
@@ -21,7 +21,6 @@ import collections
 from openstack_requirements.utils import read_requirements_file
 
 
-import packaging.specifiers
 import packaging.version
 
 
@@ -32,7 +31,7 @@ def get_requirements_version(req):
     of input requirement.
 
     """
-    for specifier in packaging.specifiers.SpecifierSet(req.specifiers):
+    for specifier in req.specifier_set:
         if '>=' in specifier.operator or '==' in specifier.operator:
             return packaging.version.parse(specifier.version)
     raise ValueError('could not find version for {}'.format(req))
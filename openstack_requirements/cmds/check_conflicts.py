@@ -15,15 +15,196 @@
 """
 
 import argparse
+import collections
+import importlib.metadata
+import os
 import sys
-import traceback
 
-import pkg_resources
+import packaging.requirements
+import packaging.utils
+import packaging.version
 
+from openstack_requirements import constraints
+from openstack_requirements import requirement
 from openstack_requirements.utils import read_requirements_file
+from openstack_requirements import wheelhouse
 
 
-def main():
+# version is None when package is not installed at all. required_by is the
+# set of the names of the installed packages with the requirement.
+Conflict = collections.namedtuple(
+    'Conflict', ['package', 'version', 'requirement', 'required_by'])
+
+
+def find_conflicts(roots, distributions, environment=None, skip=()):
+    """Find the unsatisfied requirements in an environment.
+
+    The dependency graph of the environment is walked once from roots,
+    following extras, and every requirement met on the way whose marker
+    holds is checked against the installed version.
+
+    :param roots: The canonical names of the packages to start from.
+    :param distributions: The importlib.metadata distributions installed.
+        When a package is installed more than once the first one wins, as
+        it does for imports.
+    :param environment: Marker variables to override the values of the
+        running interpreter with, e.g. to check for another python_version.
+    :param skip: Canonical names of packages whose requirements are taken
+        as satisfied without being looked up.
+    :return: A list of Conflicts, sorted by package.
+    """
+    installed = {}
+    for dist in distributions:
+        installed.setdefault(
+            packaging.utils.canonicalize_name(dist.metadata['Name']), dist)
+
+    requires = {}
+    markers = {}
+
+    def applicable(key, extra):
+        # The requirements of installed[key] when installed with extra.
+        if key not in requires:
+            requires[key] = [packaging.requirements.Requirement(r)
+                             for r in installed[key].requires or ()]
+        for req in requires[key]:
+            if req.marker is not None:
+                marker_key = (str(req.marker), extra)
+                if marker_key not in markers:
+                    markers[marker_key] = req.marker.evaluate(
+                        dict(environment or {}, extra=extra))
+                if not markers[marker_key]:
+                    continue
+            yield req
+
+    conflicts = {}
+    seen = set()
+    pending = []
+    for root in roots:
+        if root in installed:
+            pending.append((root, ''))
+        else:
+            conflicts[(root, root)] = Conflict(root, None, root, set())
+    while pending:
+        key, extra = pending.pop()
+        if (key, extra) in seen:
+            continue
+        seen.add((key, extra))
+        required_by = requirement.safe_name(installed[key].metadata['Name'])
+        for req in applicable(key, extra):
+            dep_key = packaging.utils.canonicalize_name(req.name)
+            if dep_key in skip:
+                continue
+            dep = installed.get(dep_key)
+            try:
+                satisfied = dep is not None and req.specifier.contains(
+                    dep.version, prereleases=True)
+            except packaging.version.InvalidVersion:
+                satisfied = False
+            if not satisfied:
+                conflict = conflicts.setdefault(
+                    (dep_key, str(req)),
+                    Conflict(dep.metadata['Name'] if dep else req.name,
+                             dep.version if dep else None, str(req), set()))
+                conflict.required_by.add(required_by)
+            if dep is not None:
+                pending.append((dep_key, ''))
+                pending.extend((dep_key, e) for e in sorted(req.extras))
+    return [conflicts[k] for k in sorted(conflicts)]
+
+
+class _WheelDistribution(object):
+    """Just enough of an importlib.metadata Distribution for a wheel."""
+
+    def __init__(self, wheel):
+        self.metadata = {'Name': wheel.name}
+        self.version = wheel.version
+        self.requires = list(wheel.requires)
+
+
+def _same_version(a, b):
+    try:
+        return packaging.version.Version(a) == packaging.version.Version(b)
+    except packaging.version.InvalidVersion:
+        return a == b
+
+
+def static_environment(upper_constraints, wheels, python_version):
+    """Return the environment upper_constraints pins for a python version.
+
+    :param upper_constraints: Parsed upper-constraints.txt.
+    :param wheels: As returned by wheelhouse.read_wheelhouse.
+    :param python_version: The X.Y version to pick the constraints for.
+    :return: A tuple (roots, distributions) for find_conflicts. Pinned
+        versions without a wheel are left out of distributions, so they
+        are reported as missing.
+    """
+    roots = []
+    distributions = []
+    for name, spec_list in sorted(upper_constraints.items()):
+        if not name:
+            continue
+        for req, original_line in spec_list:
+            if (req.markers and python_version not in
+                    requirement.marker_python_versions(req.markers)):
+                continue
+            key = packaging.utils.canonicalize_name(name)
+            roots.append(key)
+            version = req.specifiers.lstrip('=')
+            for wheel in wheels.get(key, ()):
+                if _same_version(wheel.version, version):
+                    distributions.append(_WheelDistribution(wheel))
+                    break
+            break
+    return roots, distributions
+
+
+def _is_xfail(conflict, xfails):
+    """Return True if upper-constraints-xfails.txt expects conflict."""
+    if conflict.version is None:
+        return False
+    key = requirement.canonical_name(conflict.package)
+    if key not in xfails:
+        return False
+    xfail_requirement = xfails[key][0][0]
+    xfail_denylists = set(xfail_requirement.markers.split(','))
+    return (conflict.required_by.issubset(xfail_denylists) and
+            xfail_requirement.package ==
+            requirement.safe_name(conflict.package).lower() and
+            xfail_requirement.specifiers == '==' + conflict.version)
+
+
+def _report(conflicts, xfails, present='is installed',
+            missing='is not installed'):
+    """Print conflicts and return the number that are errors.
+
+    :param present: How to describe the version of a package there is.
+    :param missing: How to describe a package that is not there at all.
+    """
+    error_count = 0
+    for conflict in conflicts:
+        required_by = ', '.join(sorted(conflict.required_by))
+        if conflict.version is None:
+            print('Checking conflicts for %s:\n'
+                  'DistributionNotFound: %s %s' %
+                  (required_by or conflict.package, conflict.requirement,
+                   missing))
+            error_count += 1
+            continue
+        if _is_xfail(conflict, xfails):
+            print('XFAIL while checking conflicts '
+                  'for %s: %s %s conflicts with %s' %
+                  (required_by, conflict.package, conflict.version,
+                   conflict.requirement))
+            continue
+        print('Checking conflicts for %s:\n'
+              'VersionConflict: %s %s %s but %s is required' %
+              (required_by, conflict.package, conflict.version, present,
+               conflict.requirement))
+        error_count += 1
+    return error_count
+
+
+def main(args=None):
     parser = argparse.ArgumentParser()
     parser.add_argument(
         'upper_constraints',
@@ -34,42 +215,69 @@ def main():
         default='upper-constraints-xfails.txt',
         help='Path to the upper-constraints-xfails.txt file',
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        '--wheelhouse',
+        default=None,
+        help='check the dependencies declared by the wheels of the pinned '
+             'versions in this directory instead of the installed '
+             'packages, so nothing needs to be installed')
+    parser.add_argument(
+        '-p', '--python',
+        action='append',
+        default=[],
+        help='with --wheelhouse, an X.Y python version to check for; may '
+             'be given more than once (default: the running python)')
+    parser.add_argument(
+        '-d', '--denylist',
+        default=None,
+        help='with --wheelhouse, path to the denylist.txt file, whose '
+             'packages are never pinned and so are not checked (default: '
+             'denylist.txt next to the upper-constraints file)')
+    args = parser.parse_args(args)
 
     error_count = 0
 
     print('\nChecking %s' % args.upper_constraints)
     upper_constraints = read_requirements_file(args.upper_constraints)
     xfails = read_requirements_file(args.uc_xfails)
-    for name, spec_list in upper_constraints.items():
-        try:
-            if name:
-                pyver = "python_version=='%s.%s'" % (sys.version_info[0],
-                                                     sys.version_info[1])
-                for req, original_line in spec_list:
-                    if req.markers in ["", pyver]:
-                        pkg_resources.require(name)
-        except pkg_resources.ContextualVersionConflict as e:
-            if e.dist.key in xfails:
-                xfail_requirement = xfails[e.dist.key][0][0]
-                xfail_denylists = set(xfail_requirement.markers.split(','))
-                conflict = e.dist.as_requirement()
-                conflict_specifiers = ''.join(conflict.specs[0])
-                conflict_name = conflict.name.lower()
-
-                if (e.required_by.issubset(xfail_denylists) and
-                        xfail_requirement.package == conflict_name and
-                        conflict_specifiers == xfail_requirement.specifiers):
-
-                    print('XFAIL while checking conflicts '
-                          'for %s: %s conflicts with %s' %
-                          (name, e.dist, str(e.req)))
-                    continue
 
-            print('Checking conflicts for %s:\n'
-                  'ContextualVersionConflict: %s' % (name, str(e)))
+    if args.wheelhouse:
+        wheels = wheelhouse.read_wheelhouse(args.wheelhouse)
+        # Packages which are deliberately left out of upper-constraints.txt
+        # would otherwise all be reported as missing.
+        denylist = args.denylist or os.path.join(
+            os.path.dirname(args.upper_constraints), 'denylist.txt')
+        skip = set(constraints.UNCONSTRAINABLE)
+        if args.denylist or os.path.exists(denylist):
+            skip.update(read_requirements_file(denylist))
+        skip = set(packaging.utils.canonicalize_name(name)
+                   for name in skip if name)
+        for python_version in args.python or [
+                '%d.%d' % sys.version_info[:2]]:
+            print('\nChecking python %s' % python_version)
+            roots, distributions = static_environment(
+                upper_constraints, wheels, python_version)
+            error_count += _report(
+                find_conflicts(
+                    roots, distributions,
+                    {'python_version': python_version,
+                     'python_full_version': python_version + '.0'},
+                    skip),
+                xfails, present='is pinned',
+                missing='is not pinned or has no wheel in %s' %
+                args.wheelhouse)
+        return 1 if error_count else 0
 
-            traceback.print_exc(file=sys.stdout)
-            error_count += 1
+    roots = []
+    for name, spec_list in upper_constraints.items():
+        if not name:
+            continue
+        # Only check the packages constrained for this python.
+        if any(not req.markers or
+               requirement.parse_marker(req.markers).evaluate()
+               for req, original_line in spec_list):
+            roots.append(packaging.utils.canonicalize_name(name))
+    error_count += _report(
+        find_conflicts(roots, importlib.metadata.distributions()), xfails)
 
     return 1 if error_count else 0
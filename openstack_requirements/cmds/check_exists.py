@@ -13,45 +13,117 @@
 """Check to see if a package from a project's requrements file exist in g-r or
 u-c.
 
+Any number of projects can be checked in one run. The global files are
+parsed once and the projects are checked in a process pool.
+
 """
 
 import argparse
+import os
 
-from packaging.specifiers import SpecifierSet
+from packaging.specifiers import InvalidSpecifier
+from packaging.version import InvalidVersion
 from packaging.version import Version
 
+from openstack_requirements import intervals
 from openstack_requirements import project
 from openstack_requirements import requirement
+from openstack_requirements.utils import call_captured
+from openstack_requirements.utils import find_projects
+from openstack_requirements.utils import map_with_state
 from openstack_requirements.utils import read_requirements_file
 
 
-def main(args=None):
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        'project',
-        default='',
-        help='path to the project source root folder.')
-    parser.add_argument(
-        '-u', '--upper-constraints',
-        default='upper-constraints.txt',
-        help='path to the upper-constraints.txt file')
-    parser.add_argument(
-        '-g', '--global-requirements',
-        default='global-requirements.txt',
-        help='Path to the global-requirements.txt file')
-    parser.add_argument(
-        '-b', '-d', '--denylist',
-        default='denylist.txt',
-        help='Path to the denylist.txt file')
-    parser.add_argument(
-        '-G', '--gr-check', action='store_true',
-        help='Do a specifier check of global-requirements')
-    args = parser.parse_args(args)
+def _bounds_within(spec, allowed):
+    """Return True if every bound spec sets lies within g-r's range.
+
+    A '>=' specifier is only held to the lower end of allowed and a '<' one
+    to the upper end, so a project may leave out a cap g-r has, or vice
+    versa. A bound version the specifier admits, as in '>=1.4', must not
+    be one g-r excludes either.
+
+    :param allowed: The VersionRange of the g-r specifiers.
+    """
+    own = intervals.from_specifiers(str(spec)).hull()
+    hull = allowed.hull()
+    if own is None or hull is None:
+        return False
+    bounds = intervals.Interval(
+        hull.lower if own.lower is not None else None, hull.lower_closed,
+        hull.upper if own.upper is not None else None, hull.upper_closed)
+    if not intervals.VersionRange([own]).issubset(
+            intervals.VersionRange([bounds])):
+        return False
+    for version, closed in ((own.lower, own.lower_closed),
+                            (own.upper, own.upper_closed)):
+        if version is not None and closed and version not in allowed:
+            return False
+    return True
+
+
+def _pins(uc):
+    """Return the (version string, Version) pairs an u-c entry pins.
+
+    None is returned if a pinned version is not a valid version, so that
+    only the projects using the package fail because of it.
+    """
+    pinned = uc.pinned_version
+    if pinned is not None:
+        return [(uc.specifiers[3:], pinned)]
+    # This assumes uc will only have == specifiers
+    try:
+        return [(uc_spec.version, Version(uc_spec.version))
+                for uc_spec in uc.specifier_set]
+    except (InvalidSpecifier, InvalidVersion):
+        return None
+
+
+def _gr_range(specifier_set):
+    """Return the VersionRange of a g-r specifier set, or None.
+
+    None is returned for a '===' specifier, which no VersionRange can
+    express.
+    """
+    try:
+        return intervals.compile_specifier_set(specifier_set)
+    except ValueError:
+        return None
+
+
+def load_shared_state(upper_constraints, global_requirements, denylist,
+                      gr_check=False):
+    """Parse the files every project is checked against.
+
+    The versions pinned by upper-constraints are parsed up front too, as
+    are the global-requirements ranges when gr_check is set, so checking a
+    project only has to parse the project's own files.
+    """
+    upper_constraints = read_requirements_file(upper_constraints)
+    global_requirements = read_requirements_file(global_requirements)
+    return {
+        'upper_constraints': upper_constraints,
+        'global_requirements': global_requirements,
+        'denylist': read_requirements_file(denylist),
+        'pins': {name: _pins(reqs[0][0])
+                 for name, reqs in upper_constraints.items()},
+        'gr_ranges': {
+            name: _gr_range(reqs[0][0].specifier_set)
+            for name, reqs in global_requirements.items()
+        } if gr_check else {},
+    }
+
+
+def check_project(root, state, gr_check=False):
+    """Check the requirements of the project checkout at root.
+
+    Problems are printed as they are found.
 
-    upper_constraints = read_requirements_file(args.upper_constraints)
-    global_requirements = read_requirements_file(args.global_requirements)
-    denylist = read_requirements_file(args.denylist)
-    project_data = project.read(args.project)
+    :return: The number of errors found.
+    """
+    upper_constraints = state['upper_constraints']
+    global_requirements = state['global_requirements']
+    denylist = state['denylist']
+    project_data = project.read(root)
     error_count = 0
 
     for require_file, data in project_data.get('requirements', {}).items():
@@ -72,30 +144,41 @@ def main(args=None):
                 error_count += 1
                 continue
             elif spec_list:
-                uc = upper_constraints[name][0][0]
-                gr = global_requirements[name][0][0]
-                spec_gr = SpecifierSet(gr.specifiers)
+                spec_gr = global_requirements[name][0][0].specifier_set
+                uc_pins = state['pins'][name]
+                if uc_pins is None:
+                    print(u'%s has an invalid version in upper-constraints: '
+                          '%s' % (name, upper_constraints[name][0][0]
+                                  .specifiers))
+                    error_count += 1
+                    continue
                 for req, _ in spec_list:
-                    specs = SpecifierSet(req.specifiers)
-                    # This assumes uc will only have == specifiers
-                    for uc_spec in SpecifierSet(uc.specifiers):
+                    specs = req.specifier_set
+                    for uc_version_str, uc_version in uc_pins:
                         # if the uc version isn't in the lower specifier
                         # then something is wrong.
-                        if Version(uc_spec.version) not in specs:
+                        if uc_version not in specs:
                             print(
                                 u'%s must be <= %s from upper-constraints and '
                                 'include the upper-constraints version' %
-                                (name, uc_spec.version))
+                                (name, uc_version_str))
                             error_count += 1
                             continue
-                    if args.gr_check:
+                    if gr_check:
                         for spec in specs:
                             # g-r will mostly define blocked versions. And a
                             # local project may define there own, so there is
                             # no point checking a != specifier
                             if spec.operator == '!=':
                                 continue
-                            if spec.version not in spec_gr:
+                            allowed = state['gr_ranges'][name]
+                            if allowed is None or spec.operator == '===':
+                                # Arbitrary equality has no bounds, just a
+                                # version string g-r has to accept.
+                                within = spec.version in spec_gr
+                            else:
+                                within = _bounds_within(spec, allowed)
+                            if not within:
                                 print(
                                     u'Specifier %s from %s is failing check '
                                     'from global-requirements specifiers %s' %
@@ -103,4 +186,102 @@ def main(args=None):
                                 error_count += 1
                                 continue
 
-    return 1 if error_count else 0
+    return error_count
+
+
+def _check_project_captured(state, name, root, gr_check):
+    errors, output, error = call_captured(check_project, root, state, gr_check)
+    if error:
+        output += error
+    return {'name': name, 'errors': errors or 0, 'error': error,
+            'output': output}
+
+
+def check_projects(projects, state, gr_check=False, jobs=None):
+    """Check many projects, in parallel if jobs is not 1.
+
+    :param projects: A list of (name, root) pairs.
+    :return: An iterator of per-project result dicts, in the order of
+        projects, each holding the output of the checks and the number of
+        errors found.
+    """
+    return map_with_state(
+        _check_project_captured, state,
+        [(name, root, gr_check) for name, root in projects], jobs)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'projects',
+        nargs='*',
+        metavar='project',
+        help='path to a project source root folder; may be repeated')
+    parser.add_argument(
+        '-p', '--projects-list',
+        default=None,
+        help='path to a projects.txt file listing further repos to check, '
+             'found under --root')
+    parser.add_argument(
+        '--root',
+        default='.',
+        help='directory holding the repos of --projects-list')
+    parser.add_argument(
+        '-u', '--upper-constraints',
+        default='upper-constraints.txt',
+        help='path to the upper-constraints.txt file')
+    parser.add_argument(
+        '-g', '--global-requirements',
+        default='global-requirements.txt',
+        help='Path to the global-requirements.txt file')
+    parser.add_argument(
+        '-b', '-d', '--denylist',
+        default='denylist.txt',
+        help='Path to the denylist.txt file')
+    parser.add_argument(
+        '-G', '--gr-check', action='store_true',
+        help='Do a specifier check of global-requirements')
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=None,
+        help='number of worker processes (default: number of CPUs)')
+    args = parser.parse_args(args)
+
+    projects = [(root, root) for root in args.projects]
+    missing = []
+    if args.projects_list:
+        for name, root in find_projects(
+                args.root, args.projects_list):
+            if os.path.isdir(root):
+                projects.append((name, root))
+            else:
+                missing.append(name)
+    if not projects and not missing:
+        parser.error('no project to check')
+
+    state = load_shared_state(
+        args.upper_constraints, args.global_requirements, args.denylist,
+        args.gr_check)
+    results = []
+    for result in check_projects(projects, state, args.gr_check, args.jobs):
+        if len(projects) > 1:
+            print(u'\nChecking %s' % result['name'])
+        print(result['output'], end='')
+        results.append(result)
+
+    if len(projects) + len(missing) > 1:
+        print(u'\nSummary:')
+        for result in results:
+            if result['error']:
+                status = u'failed to check'
+            elif result['errors']:
+                status = u'%d errors' % result['errors']
+            else:
+                status = u'OK'
+            print(u'  %s: %s' % (result['name'], status))
+        for name in missing:
+            print(u'  %s: not found under %s' % (name, args.root))
+
+    failed = [r for r in results if r['errors'] or r['error']]
+    return 1 if failed or missing else 0
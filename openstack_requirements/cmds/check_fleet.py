@@ -0,0 +1,173 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Check the requirements of many projects against the global list.
+
+This runs the same checks as the requirements-check job does for a single
+project, but loads the global state once and checks every project in one
+process pool, producing a single JSON report.
+
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+from openstack_requirements import check
+from openstack_requirements import project
+from openstack_requirements.utils import call_captured
+from openstack_requirements.utils import find_projects
+from openstack_requirements.utils import map_with_state
+from openstack_requirements.utils import read_requirements_file
+
+
+PYTHON_3_BRANCH = re.compile(r'^stable\/[u-z].*')
+
+
+def load_global_state(reqs_dir):
+    """Load the global requirements data shared by every project check.
+
+    :param reqs_dir: Path to a checkout of openstack/requirements.
+    :return: A dict with global_reqs, denylist and backports keys.
+    """
+    with open(os.path.join(reqs_dir, 'global-requirements.txt'), 'rt') as f:
+        global_reqs = check.get_global_reqs(f.read())
+    denylist = read_requirements_file(os.path.join(reqs_dir, 'denylist.txt'))
+    backports_file = os.path.join(reqs_dir, 'backports.txt')
+    if os.path.exists(backports_file):
+        backports = read_requirements_file(backports_file)
+    else:
+        backports = {}
+    return {
+        'global_reqs': global_reqs,
+        'denylist': denylist,
+        'backports': list(backports.keys()),
+    }
+
+
+def _check(name, root, global_state, branch):
+    """Run the checks of the requirements-check job on a project.
+
+    :return: True if the project failed them.
+    """
+    strict = not branch.startswith('stable/')
+    allow_3_only = bool(strict or PYTHON_3_BRANCH.match(branch))
+    proj = project.read(root)
+    reqs = check.RequirementsList(name, proj)
+    reqs.process(strict=strict)
+    failed = check.validate(
+        reqs,
+        global_state['denylist'],
+        global_state['global_reqs'],
+        global_state['backports'],
+        allow_3_only=allow_3_only,
+    )
+    failed = (
+        check.validate_lower_constraints(
+            reqs,
+            proj['lower-constraints.txt'],
+            global_state['denylist'],
+        )
+        or failed
+    )
+    return bool(failed or reqs.failed)
+
+
+def check_project(name, root, global_state, branch='master'):
+    """Check a single project checkout.
+
+    :return: A dict describing the result, suitable for the JSON report.
+    """
+    failed, output, error = call_captured(
+        _check, name, root, global_state, branch)
+    return {
+        'name': name,
+        'root': root,
+        'failed': True if error else failed,
+        'error': error,
+        'output': output,
+    }
+
+
+def _check_project_with_state(global_state, name, root, branch):
+    return check_project(name, root, global_state, branch)
+
+
+def check_projects(projects, global_state, branch='master', jobs=None):
+    """Check many projects, in parallel if jobs is not 1.
+
+    :return: A list of per-project result dicts in the order of projects.
+    """
+    return list(map_with_state(
+        _check_project_with_state, global_state,
+        [(name, path, branch) for name, path in projects], jobs))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'root',
+        help='directory holding the project checkouts')
+    parser.add_argument(
+        '-p', '--projects',
+        default=None,
+        help='path to a projects.txt file listing the repos under root to '
+             'check; by default every directory under root is checked')
+    parser.add_argument(
+        '-r', '--reqs',
+        default='.',
+        help='path to the openstack/requirements tree to check against')
+    parser.add_argument(
+        '-b', '--branch',
+        default='master',
+        help='target branch, which selects the strictness of the checks')
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=None,
+        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument(
+        '-o', '--output',
+        default=None,
+        help='write the JSON report here instead of to stdout')
+    args = parser.parse_args(args)
+
+    global_state = load_global_state(args.reqs)
+    projects = []
+    missing = []
+    for name, path in find_projects(args.root, args.projects):
+        if os.path.isdir(path):
+            projects.append((name, path))
+        else:
+            missing.append(name)
+
+    results = check_projects(projects, global_state, args.branch, args.jobs)
+    failed = [r['name'] for r in results if r['failed']]
+    report = {
+        'branch': args.branch,
+        'checked': len(results),
+        'failed': failed,
+        'missing': missing,
+        'projects': results,
+    }
+    if args.output:
+        with open(args.output, 'wt') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    # Listed projects that are not checked out went unchecked, which must
+    # not pass for success.
+    return 1 if failed or missing else 0
@@ -14,7 +14,7 @@
 
 import argparse
 
-import pkg_resources
+from packaging import requirements
 import requests
 
 
@@ -47,7 +47,7 @@ def main():
 
     for line in open(args.requirements, 'r'):
         try:
-            req = pkg_resources.Requirement.parse(line)
+            req = requirements.Requirement(line.partition(' #')[0].strip())
         except ValueError:
             # Assume this is a comment and skip it.
             continue
@@ -58,17 +58,17 @@ def main():
         # selector value for things like python version, so drop
         # anything after the first semicolon.
         version = list(req.specifier)[0].version.split(';')[0]
-        data = _get_metadata(req.project_name, version)
+        data = _get_metadata(req.name, version)
         classifiers = data.get('info', {}).get('classifiers', [])
         for classifier in classifiers:
             if classifier.startswith('Programming Language :: Python :: 2'):
                 if args.verbose:
                     print('{}==={} {!r}'.format(
-                        req.project_name, version, classifier))
+                        req.name, version, classifier))
                 break
         else:
             print('\nNo "Python :: 2" classifier found for {}==={}'.format(
-                req.project_name, version))
+                req.name, version))
             for classifier in classifiers:
                 print('  {}'.format(classifier))
 
@@ -11,42 +11,343 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import concurrent.futures
+import contextlib
 import copy
 from datetime import datetime
+import fcntl
+import functools
+import glob
 import hashlib
+import importlib.metadata
+import json
 import optparse
 import os.path
 import shutil
 import subprocess
 import sys
 import tempfile
+import time
 
 import fixtures
+from packaging import requirements as packaging_requirements
+from packaging import utils as packaging_utils
 
 from openstack_requirements import requirement
+from openstack_requirements import utils
+from openstack_requirements import wheelhouse as wheelhouse_metadata
 
 
-def _parse_freeze(text):
-    """Parse a freeze into structured data.
+def _freeze_excludes(version):
+    """Return the packages pip freeze leaves out on python version X.Y."""
+    if tuple(int(v) for v in version.split('.')[:2]) < (3, 12):
+        return frozenset(['pip', 'setuptools', 'wheel', 'distribute'])
+    # From 3.12 on, pip no longer assumes the build backends are present.
+    return frozenset(['pip'])
 
-    :param text: The output from a pip freeze command.
+
+def _read_installed(venv, version):
+    """Read the distributions installed in a venv, as pip freeze would.
+
+    The metadata is read straight from the venv's site-packages, rather
+    than starting the venv's python to run pip freeze.
+
+    :param venv: The path to the venv.
+    :param version: The X.Y version of the venv's python.
     :return: A list of (package, version) tuples.
     """
+    excludes = _freeze_excludes(version)
     result = []
-    for line in text.splitlines():
-        line = line.strip()
-        if line.startswith('-'):
-            raise Exception("Irregular line: %s" % line)
-        if line.startswith('#'):
-            continue
-        if not line:
+    for site_packages in glob.glob(
+            os.path.join(venv, 'lib', 'python*', 'site-packages')):
+        for name in os.listdir(site_packages):
+            if name.endswith('.egg-link'):
+                raise Exception("Irregular install: %s" % name)
+        for dist in importlib.metadata.distributions(path=[site_packages]):
+            package = dist.metadata['Name']
+            direct_url = dist.read_text('direct_url.json')
+            if direct_url:
+                # Editable, VCS and other direct URL installs, which pip
+                # freeze would not list as package==version.
+                raise Exception("Irregular install: %s from %s" % (
+                    package, json.loads(direct_url)['url']))
+            if packaging_utils.canonicalize_name(package) in excludes:
+                continue
+            result.append((package, dist.version))
+    return sorted(result, key=lambda item: item[0].lower())
+
+
+def _parse_report(text, version, installed=()):
+    """Parse a pip installation report into structured data.
+
+    The report only lists what the requirements pull in. A real install
+    keeps whatever the venv held already as well, notably the bootstrap
+    setuptools and wheel which a freeze lists from python 3.12 on, so those
+    are passed in as installed to give the same result.
+
+    :param text: The JSON written by pip install --dry-run --report.
+    :param version: The X.Y version of the python the report is for.
+    :param installed: The (package, version) tuples read from the venv
+        before the install, as from _read_installed. The report wins for
+        packages in both.
+    :return: A list of (package, version) tuples, like _read_installed.
+    """
+    excludes = _freeze_excludes(version)
+    result = {}
+    report = [(item['metadata']['name'], item['metadata']['version'])
+              for item in json.loads(text)['install']]
+    for package, package_version in list(installed) + report:
+        name = packaging_utils.canonicalize_name(package)
+        if name in excludes:
             continue
-        package, version = line.split('==')[:2]
-        result.append((package, version))
-    return result
+        result[name] = (package, package_version)
+    return sorted(result.values(), key=lambda item: item[0].lower())
+
+
+def _open_log(python):
+    """Open a log file for the freeze job using python.
+
+    Each job gets a file of its own so that jobs run in parallel do not
+    interleave their output.
+    """
+    return tempfile.NamedTemporaryFile(
+        mode='w+b',
+        prefix=datetime.now().strftime(
+            'generate-constraints-%Y_%m_%d_%H_%M-'
+        ) + '%s-' % os.path.basename(python),
+        suffix='.log',
+        delete=False,
+    )
+
+
+# The packages installed into every venv before the requirements are.
+BOOTSTRAP_PACKAGES = ['pip', 'setuptools', 'wheel']
+
+# Venv templates older than this many seconds are rebuilt, so that new
+# releases of unpinned bootstrap packages get picked up.
+TEMPLATE_MAX_AGE = 24 * 60 * 60
+
+
+def _wheels(wheelhouse):
+    """Return the file names of the wheels in wheelhouse."""
+    try:
+        return set(f for f in os.listdir(wheelhouse) if f.endswith('.whl'))
+    except FileNotFoundError:
+        return set()
+
+
+def _wheel_packages(wheels):
+    """Return the canonical names of the packages wheels are for."""
+    return set(
+        packaging_utils.canonicalize_name(f.split('-')[0]) for f in wheels)
+
+
+def _missing_wheels(wheelhouse, packages):
+    """Return the packages that have no wheel at all in wheelhouse."""
+    present = _wheel_packages(_wheels(wheelhouse))
+    return [
+        p for p in packages
+        if packaging_utils.canonicalize_name(
+            requirement.parse_line(p).package) not in present
+    ]
+
+
+def _build_wheels(run, venv_python, args, wheelhouse):
+    """Build wheels for the pip arguments args into wheelhouse.
+
+    Wheels are built in a private directory and then moved into place one
+    by one, so that concurrent jobs installing from the wheelhouse never
+    see a partially written wheel.
+    """
+    os.makedirs(wheelhouse, exist_ok=True)
+    build_dir = tempfile.mkdtemp(dir=wheelhouse, prefix='.build-')
+    try:
+        run([venv_python, '-m', 'pip', 'wheel', '--wheel-dir', build_dir,
+             '--find-links', wheelhouse] + args)
+        for name in os.listdir(build_dir):
+            os.replace(os.path.join(build_dir, name),
+                       os.path.join(wheelhouse, name))
+    finally:
+        shutil.rmtree(build_dir)
+
+
+def _pip_install(run, venv_python, args, wheelhouse=None, upgrade=False,
+                 report=None):
+    """Run pip install args in the venv of venv_python.
 
+    With a wheelhouse, packages are only ever installed from it. Wheels
+    missing from it are built (which needs the index) once, after which
+    the same install does not touch the network at all.
 
-def _freeze(requirements, python):
+    :param report: If not None, only resolve args and write pip's
+        installation report to this path instead of installing anything.
+    """
+    install = [venv_python, '-m', 'pip', 'install']
+    if upgrade:
+        install.append('-U')
+    if report is not None:
+        install += ['--dry-run', '--ignore-installed', '--report', report]
+    if wheelhouse is None:
+        run(install + args)
+        return
+    install += ['--no-index', '--find-links', wheelhouse]
+    try:
+        run(install + args)
+    except subprocess.CalledProcessError:
+        _build_wheels(run, venv_python, args, wheelhouse)
+        run(install + args)
+
+
+def _create_venv(python, path, run, bootstrap=BOOTSTRAP_PACKAGES,
+                 wheelhouse=None):
+    """Create a venv at path and install the bootstrap packages into it."""
+    run([python, '-m', 'venv', path])
+    venv_python = os.path.join(path, 'bin', 'python')
+    if wheelhouse is not None and _missing_wheels(wheelhouse, bootstrap):
+        # An install from the wheelhouse would quietly keep the bootstrap
+        # packages venv came with, so fetch them explicitly.
+        _build_wheels(run, venv_python, list(bootstrap), wheelhouse)
+    _pip_install(run, venv_python, list(bootstrap), wheelhouse, upgrade=True)
+
+
+def _template_name(python, version, bootstrap, wheelhouse=None):
+    """Return the name of the venv template for python.
+
+    :param version: The full version of python, e.g. 3.10.12.
+    :param bootstrap: The bootstrap package specifiers.
+    :param wheelhouse: The wheelhouse the bootstrap packages come from, if
+        any.
+    """
+    key = '\n'.join(
+        [os.path.realpath(shutil.which(python) or python), version,
+         os.path.realpath(wheelhouse) if wheelhouse else '']
+        + sorted(bootstrap))
+    return '%s-%s' % (
+        version, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16])
+
+
+def _clone_tree(src, dst):
+    """Copy the tree at src to dst, hardlinking files where possible.
+
+    Nothing in the clone is modified in place - pip replaces or removes
+    files rather than rewriting them - so sharing inodes with the template
+    is safe.
+    """
+    def link_or_copy(src_file, dst_file):
+        try:
+            os.link(src_file, dst_file)
+        except OSError:
+            shutil.copy2(src_file, dst_file)
+    shutil.copytree(src, dst, symlinks=True, copy_function=link_or_copy)
+
+
+def _venv_from_template(python, version, path, run, template_dir,
+                        bootstrap=BOOTSTRAP_PACKAGES, wheelhouse=None):
+    """Create a venv at path by cloning a bootstrapped template venv.
+
+    The template for python is built first if it is missing or too old.
+    Since the scripts copied from the template still point at the template,
+    the clone must be driven through its bin/python (python -m pip).
+
+    Concurrent jobs share templates through a lock file next to each one:
+    it is held exclusively to check and (re)build the template, and shared
+    while cloning it, so a template is never replaced under a clone.
+    """
+    name = _template_name(python, version, bootstrap, wheelhouse)
+    template = os.path.join(template_dir, name)
+    os.makedirs(template_dir, exist_ok=True)
+    with open(os.path.join(template_dir, '.%s.lock' % name), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            fresh = (time.time() - os.path.getmtime(template) <
+                     TEMPLATE_MAX_AGE)
+        except OSError:
+            fresh = False
+        if not fresh:
+            build_dir = tempfile.mkdtemp(dir=template_dir, prefix='.build-')
+            try:
+                _create_venv(
+                    python, os.path.join(build_dir, 'venv'), run, bootstrap,
+                    wheelhouse)
+                if os.path.exists(template):
+                    shutil.rmtree(template)
+                os.rename(os.path.join(build_dir, 'venv'), template)
+            finally:
+                shutil.rmtree(build_dir)
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        _clone_tree(template, path)
+
+
+class _FreezeStats(object):
+    """Where the time of a single freeze goes.
+
+    Time spent in a phase nested inside another one is only counted
+    against the inner phase, so the phases add up to the total.
+    """
+
+    def __init__(self, record):
+        """Collect into the dict record, which ends up in the stats report.
+
+        Sets the keys phases (seconds per phase), peak_rss_kb (the largest
+        maximum resident set size of any command run, including the
+        processes it waited for), wheels_built and wheels_reused (wheelhouse
+        runs only, otherwise None) and cached.
+        """
+        self.record = record
+        record.update(
+            cached=False, phases={}, peak_rss_kb=0, wheels_built=None,
+            wheels_reused=None)
+        self._nested = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            phases = self.record['phases']
+            phases[name] = phases.get(name, 0.0) + elapsed - nested
+
+    def run(self, cmd, log):
+        """Run cmd like subprocess.check_call, recording its phase and RSS.
+
+        The phase is inferred from the command, which is one of the few
+        _create_venv, _build_wheels and _pip_install issue.
+        """
+        if cmd[1:3] == ['-m', 'venv']:
+            phase = 'venv'
+        elif cmd[1:4] == ['-m', 'pip', 'wheel']:
+            phase = 'build'
+        elif '--dry-run' in cmd:
+            phase = 'resolve'
+        elif '-U' in cmd:
+            phase = 'bootstrap'
+        else:
+            phase = 'install'
+        with self.phase(phase):
+            proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+            # wait4 rather than wait, to get at the resource usage of this
+            # command alone.
+            _, status, rusage = os.wait4(proc.pid, 0)
+            # As subprocess reports it; os.waitstatus_to_exitcode would do
+            # but needs python 3.9.
+            if os.WIFSIGNALED(status):
+                proc.returncode = -os.WTERMSIG(status)
+            else:
+                proc.returncode = os.WEXITSTATUS(status)
+        self.record['peak_rss_kb'] = max(
+            self.record['peak_rss_kb'], rusage.ru_maxrss)
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+def _freeze(requirements, python, venv_templates=None, wheelhouse=None,
+            resolve_only=False, stats=None):
     """Generate a frozen install from requirements.
 
     A constraints file is the result of installing a set of requirements and
@@ -63,52 +364,420 @@ def _freeze(requirements, python):
     not triggering installation, so we can and will list packages that are
     not relevant to e.g. Python3 in the constraints output.
 
+    The output of every command run is written to a log file of its own,
+    which is kept after the job finishes.
+
     :param requirements: The path to a requirements file to use when generating
         the constraints.
     :param python: A Python binary to use. E.g. /usr/bin/python3
+    :param venv_templates: If not None, a directory to keep bootstrapped venv
+        templates in. The venv is then cloned from a template instead of
+        being created and bootstrapped from scratch.
+    :param wheelhouse: If not None, a directory of wheels to install from
+        instead of the package index. Missing wheels are built into it.
+    :param resolve_only: If True, take the result from pip's resolver
+        without building or installing the requirements. This needs pip
+        22.2 or newer in the venv.
+    :param stats: If not None, a dict to fill in with the timings and
+        resource usage of the freeze; see _FreezeStats.
     :return: A tuple (python_version, list of (package, version)'s)
     """
-    output = []
-    try:
-        version_out = subprocess.check_output(
-            [python, "--version"], stderr=subprocess.STDOUT)
-        output.append(version_out)
-        version_all = version_out.decode('utf-8').split()[1]
-        version = '.'.join(version_all.split('.')[:2])
-        with fixtures.TempDir() as temp:
-            output.append(subprocess.check_output(
-                [python, '-m', 'venv', temp.path]))
-            pip_bin = os.path.join(temp.path, 'bin', 'pip')
-            output.append(subprocess.check_output(
-                [pip_bin, 'install', '-U', 'pip', 'setuptools', 'wheel']))
-            output.append(subprocess.check_output(
-                [pip_bin, 'install', '-r', requirements]))
-            freeze = subprocess.check_output(
-                [pip_bin, 'freeze'])
-            output.append(freeze)
-            return (version, _parse_freeze(freeze.decode('utf-8')))
-    except Exception as exc:
-        if isinstance(exc, subprocess.CalledProcessError):
-            output.append(exc.output)
-        raise Exception(
-            "Failed to generate freeze: %s %s" % (
-                b'\n'.join(output).decode('utf-8'),
-                exc,
+    stats = _FreezeStats({} if stats is None else stats)
+    with _open_log(python) as log:
+        def run(cmd):
+            log.flush()
+            stats.run(cmd, log)
+
+        try:
+            start = time.monotonic()
+            version_out = subprocess.check_output(
+                [python, "--version"], stderr=subprocess.STDOUT)
+            log.write(version_out)
+            version_all = version_out.decode('utf-8').split()[1]
+            version = '.'.join(version_all.split('.')[:2])
+            stats.record['version'] = version
+            if wheelhouse is not None:
+                wheels_before = _wheels(wheelhouse)
+            with fixtures.TempDir() as temp:
+                venv = os.path.join(temp.path, 'venv')
+                if venv_templates:
+                    # Whatever the commands run to (re)build the template
+                    # do not account for is the cloning itself.
+                    with stats.phase('clone'):
+                        _venv_from_template(
+                            python, version_all, venv, run, venv_templates,
+                            wheelhouse=wheelhouse)
+                else:
+                    _create_venv(python, venv, run, wheelhouse=wheelhouse)
+                venv_python = os.path.join(venv, 'bin', 'python')
+                if resolve_only:
+                    report = os.path.join(temp.path, 'report.json')
+                    _pip_install(
+                        run, venv_python, ['-r', requirements], wheelhouse,
+                        report=report)
+                    with stats.phase('freeze'), open(report, 'rt') as f:
+                        frozen = _parse_report(
+                            f.read(), version,
+                            installed=_read_installed(venv, version))
+                else:
+                    _pip_install(
+                        run, venv_python, ['-r', requirements], wheelhouse)
+                    with stats.phase('freeze'):
+                        frozen = _read_installed(venv, version)
+                    log.write(''.join(
+                        '%s==%s\n' % item for item in frozen).encode('utf-8'))
+            if wheelhouse is not None:
+                # Wheels other jobs added meanwhile count as built too.
+                stats.record['wheels_built'] = len(
+                    _wheels(wheelhouse) - wheels_before)
+                reused = _wheel_packages(wheels_before)
+                stats.record['wheels_reused'] = sum(
+                    1 for package, _ in frozen
+                    if packaging_utils.canonicalize_name(package) in reused)
+            stats.record['total'] = time.monotonic() - start
+            return (version, frozen)
+        except Exception as exc:
+            if isinstance(exc, subprocess.CalledProcessError) and exc.output:
+                log.write(exc.output)
+            log.flush()
+            log.seek(0)
+            raise Exception(
+                "Failed to generate freeze (log in %s): %s %s" % (
+                    log.name,
+                    log.read().decode('utf-8', 'replace'),
+                    exc,
+                )
             )
-        )
-    finally:
-        # log job results
-        with tempfile.NamedTemporaryFile(
-            mode='w+b',
-            prefix=datetime.now().strftime(
-                'generate-constraints-%Y_%m_%d_%H_%M-'
-            ),
-            delete=False,
-        ) as fh:
-            fh.write(b'\n'.join(output))
-
-
-def _combine_freezes(freezes, denylist=None):
+
+
+# Bump this whenever the output of _freeze or the cache entries change,
+# so cached freezes written by older code are not picked up.
+_FREEZE_CACHE_FORMAT = 3
+
+
+def _freeze_key(requirements, python, wheelhouse=None, resolve_only=False,
+                bootstrap=BOOTSTRAP_PACKAGES):
+    """Return the cache key for a _freeze of requirements with python.
+
+    The key covers the inputs known before freezing. The wheelhouse stands
+    in for a snapshot of the package index, so without one there is no key:
+    the same inputs can freeze differently against a live index from one
+    day to the next. Which of its wheels matter is only known once frozen;
+    see _freeze_wheels.
+
+    :return: A hex digest, or None if the freeze cannot be cached.
+    """
+    if wheelhouse is None:
+        return None
+    version = subprocess.check_output(
+        [python, '--version'], stderr=subprocess.STDOUT)
+    with open(requirements, 'rb') as f:
+        requirements_digest = hashlib.sha256(f.read()).hexdigest()
+    key = '\n'.join(
+        [str(_FREEZE_CACHE_FORMAT), requirements_digest,
+         os.path.realpath(shutil.which(python) or python),
+         version.decode('utf-8').strip(), str(resolve_only)]
+        + sorted(bootstrap))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _freeze_wheels(wheelhouse, packages):
+    """Return the wheels in wheelhouse for any of packages, sorted.
+
+    A freeze picks the best of the wheels for each package it resolved,
+    and of those for the bootstrap packages. As long as that set of wheels
+    stays the same, so does the freeze, whatever other wheels come and go.
+
+    :param packages: Canonical package names.
+    """
+    return sorted(
+        f for f in _wheels(wheelhouse)
+        if packaging_utils.canonicalize_name(f.split('-')[0]) in packages)
+
+
+def _cached_freeze(requirements, python, cache_dir, force=False,
+                   bootstrap=BOOTSTRAP_PACKAGES, **kwargs):
+    """Run _freeze, reusing the result of an earlier run with equal inputs.
+
+    Each cache entry records the packages the freeze resolved, including
+    the bootstrap ones, and their wheels at the time. The entry is reused
+    while the wheelhouse still holds exactly those wheels for them.
+
+    :param cache_dir: The directory cached freezes are kept in.
+    :param force: If True, always freeze, but still update the cache.
+    :param kwargs: Passed on to _freeze.
+    """
+    wheelhouse = kwargs.get('wheelhouse')
+    key = _freeze_key(
+        requirements, python, wheelhouse=wheelhouse,
+        resolve_only=kwargs.get('resolve_only', False), bootstrap=bootstrap)
+    if key is None:
+        return _freeze(requirements, python, **kwargs)
+    path = os.path.join(cache_dir, key + '.pickle')
+    if not force:
+        cached = utils.load_snapshot(path)
+        if (cached is not None and
+                cached['wheels'] == _freeze_wheels(
+                    wheelhouse, cached['packages'])):
+            if kwargs.get('stats') is not None:
+                _FreezeStats(kwargs['stats']).record.update(
+                    cached=True, version=cached['result'][0])
+            return cached['result']
+    result = _freeze(requirements, python, **kwargs)
+    packages = frozenset(
+        [packaging_utils.canonicalize_name(package)
+         for package, _ in result[1]] +
+        [packaging_utils.canonicalize_name(
+            requirement.parse_line(p).package) for p in bootstrap])
+    # Freezing may have built new wheels into the wheelhouse, so record
+    # what the next run will find there.
+    utils.save_snapshot(path, {
+        'packages': packages,
+        'wheels': _freeze_wheels(wheelhouse, packages),
+        'result': result,
+    })
+    return result
+
+
+# Sharding only pays off while no single group of interdependent
+# requirements dominates; above this fraction of the requirements, they
+# are frozen in one piece.
+MAX_SHARD_FRACTION = 0.8
+
+
+def _requirement_components(reqs, wheels):
+    """Group requirements whose dependency trees may overlap.
+
+    Two requirements end up in the same group when their transitive
+    dependencies, as far as the wheels tell, share a package. Dependencies
+    are followed whatever their markers and extras, which can only make
+    groups larger. The dependencies of requirements without any wheel are
+    unknown, so those all go into one group.
+
+    :param reqs: A list of (canonical name, requirement line) tuples.
+    :param wheels: As returned by wheelhouse.read_wheelhouse.
+    :return: A list of lists of requirement lines, largest first.
+    """
+    parent = {}
+
+    def find(name):
+        parent.setdefault(name, name)
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    def union(a, b):
+        parent[find(a)] = find(b)
+
+    seen = set()
+    unknown = None
+    for name, _ in reqs:
+        if name not in wheels:
+            if unknown is None:
+                unknown = name
+            union(name, unknown)
+        pending = [name]
+        while pending:
+            node = pending.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            for wheel in wheels.get(node, ()):
+                for dep in wheel.requires:
+                    dep = packaging_utils.canonicalize_name(
+                        packaging_requirements.Requirement(dep).name)
+                    union(node, dep)
+                    pending.append(dep)
+    groups = {}
+    for name, line in reqs:
+        groups.setdefault(find(name), []).append(line)
+    return sorted(groups.values(), key=len, reverse=True)
+
+
+def _plan_shards(requirements, wheels, count):
+    """Split a requirements file into shards to freeze independently.
+
+    :param wheels: As returned by wheelhouse.read_wheelhouse.
+    :param count: The most shards to make. Groups of requirements are
+        packed into them largest first, keeping the shards similar in size.
+    :return: A list of requirements file bodies, or None if requirements
+        are better frozen in one piece.
+    """
+    with open(requirements, 'rt') as f:
+        content = f.read()
+    reqs = []
+    options = []
+    for req, line in requirement.to_reqs(content):
+        line = line.rstrip('\n') + '\n'
+        if req is None:
+            # Options such as -f apply to every shard.
+            options.append(line)
+        elif req.package:
+            reqs.append((requirement.canonical_name(req.package), line))
+    components = _requirement_components(reqs, wheels)
+    if (len(components) < 2 or
+            len(components[0]) > MAX_SHARD_FRACTION * len(reqs)):
+        return None
+    shards = [[] for _ in range(min(count, len(components)))]
+    for component in components:
+        min(shards, key=len).extend(component)
+    return [''.join(options + shard) for shard in shards]
+
+
+def _merge_shards(version, freezes, wheels):
+    """Merge the freezes of the shards of a requirements file.
+
+    The merge is only good if there are no problems: every package is
+    frozen at a single version, and as far as the wheels tell, every
+    dependency of every frozen package is frozen at a version it accepts.
+
+    :param version: The X.Y version of the python the freezes are for.
+    :param freezes: A list of lists of (package, version) tuples.
+    :param wheels: As returned by wheelhouse.read_wheelhouse.
+    :return: A tuple (list of (package, version), list of problems).
+    """
+    pins = {}
+    problems = []
+    for frozen in freezes:
+        for package, package_version in frozen:
+            key = packaging_utils.canonicalize_name(package)
+            if key in pins and pins[key][1] != package_version:
+                problems.append('%s is frozen at both %s and %s' % (
+                    package, pins[key][1], package_version))
+            pins.setdefault(key, (package, package_version))
+    excludes = _freeze_excludes(version)
+    environment = {
+        'python_version': version,
+        'python_full_version': version + '.0',
+        'extra': '',
+    }
+    for key, (package, package_version) in sorted(pins.items()):
+        for wheel in wheels.get(key, ()):
+            if wheel.version != package_version:
+                continue
+            for dep in wheel.requires:
+                dep = packaging_requirements.Requirement(dep)
+                if dep.marker and not dep.marker.evaluate(environment):
+                    continue
+                dep_key = packaging_utils.canonicalize_name(dep.name)
+                if dep_key in excludes:
+                    continue
+                pinned = pins.get(dep_key)
+                if pinned is None or not dep.specifier.contains(
+                        pinned[1], prereleases=True):
+                    problems.append('%s %s needs %s, frozen at %s' % (
+                        package, package_version, dep,
+                        pinned[1] if pinned else 'nothing'))
+            break
+    merged = sorted(pins.values(), key=lambda item: item[0].lower())
+    return merged, problems
+
+
+def _freeze_all(requirements, pythons, jobs=1, cache_dir=None, force=False,
+                stats=None, shard=False, **kwargs):
+    """Run _freeze for each of pythons, up to jobs freezes at a time.
+
+    The freezes only share pip's cache, which pip updates atomically, so
+    they can safely run side by side.
+
+    :param cache_dir: If not None, a directory to cache freezes in; see
+        _cached_freeze.
+    :param force: Passed on to _cached_freeze.
+    :param stats: If not None, a list to append the stats of each freeze
+        to.
+    :param shard: If True and a wheelhouse is given, split requirements
+        into shards with no dependencies in common (see _plan_shards),
+        freeze every shard with every python, and merge the results. If
+        the shards frozen with a python do not merge cleanly, requirements
+        are frozen with it in one piece instead.
+    :param kwargs: Passed on to _freeze.
+    :return: A list of _freeze results, in the order of pythons.
+    """
+    if cache_dir is None:
+        freeze = functools.partial(_freeze, **kwargs)
+    else:
+        freeze = functools.partial(
+            _cached_freeze, cache_dir=cache_dir, force=force, **kwargs)
+
+    def run_all(tasks):
+        # tasks is a list of (requirements, python, stats record) tuples.
+        calls = []
+        for task_requirements, python, record in tasks:
+            if stats is None:
+                calls.append(functools.partial(
+                    freeze, task_requirements, python))
+            else:
+                stats.append(record)
+                calls.append(functools.partial(
+                    freeze, task_requirements, python, stats=record))
+        if jobs <= 1 or len(calls) <= 1:
+            return [call() for call in calls]
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=jobs) as executor:
+            return list(executor.map(lambda call: call(), calls))
+
+    wheelhouse = kwargs.get('wheelhouse')
+    shards = None
+    if shard and wheelhouse is not None and jobs > 1:
+        shards = _plan_shards(
+            requirements, wheelhouse_metadata.read_wheelhouse(wheelhouse),
+            jobs)
+    if shards is None:
+        return run_all([(requirements, python, {'python': python})
+                        for python in pythons])
+
+    with fixtures.TempDir() as temp:
+        paths = []
+        for index, body in enumerate(shards):
+            paths.append(os.path.join(temp.path, 'shard-%d.txt' % index))
+            with open(paths[-1], 'wt') as f:
+                f.write(body)
+        results = run_all([
+            (path, python, {'python': python, 'shard': index})
+            for python in pythons for index, path in enumerate(paths)])
+    # Freezing may have built new wheels, so read the metadata again.
+    wheels = wheelhouse_metadata.read_wheelhouse(wheelhouse)
+    freezes = []
+    unmerged = []
+    for index, python in enumerate(pythons):
+        parts = results[index * len(paths):(index + 1) * len(paths)]
+        version = parts[0][0]
+        merged, problems = _merge_shards(
+            version, [frozen for _, frozen in parts], wheels)
+        if problems:
+            print("Shards frozen with %s do not merge, freezing in one "
+                  "piece:\n  %s" % (python, '\n  '.join(problems)),
+                  file=sys.stderr)
+            unmerged.append(index)
+        freezes.append((version, merged))
+    redone = run_all([
+        (requirements, pythons[index], {'python': pythons[index]})
+        for index in unmerged])
+    for index, result in zip(unmerged, redone):
+        freezes[index] = result
+    return freezes
+
+
+def _compact_marker(py_versions, reference_versions):
+    """Return a marker selecting py_versions out of reference_versions.
+
+    :param py_versions: The X.Y versions to select.
+    :param reference_versions: All the X.Y versions frozen.
+    """
+    py_versions = sorted(py_versions, key=requirement.python_version_key)
+    if len(py_versions) == 1:
+        return "python_version=='%s'" % py_versions[0]
+    reference_versions = sorted(
+        reference_versions, key=requirement.python_version_key)
+    if py_versions == reference_versions[-len(py_versions):]:
+        return "python_version>='%s'" % py_versions[0]
+    if py_versions == reference_versions[:len(py_versions)]:
+        return "python_version<'%s'" % reference_versions[len(py_versions)]
+    return "python_version in '%s'" % ' '.join(py_versions)
+
+
+def _combine_freezes(freezes, denylist=None, compact=False):
     """Combine multiple freezes into a single structure.
 
     This deals with the variation between different python versions by
@@ -118,6 +787,9 @@ def _combine_freezes(freezes, denylist=None):
     :param freezes: A list of (python_version, frozen_requirements) tuples.
     :param denylist: An iterable of package names to exclude. These packages
         won't be included in the output.
+    :param compact: If True, write a single line for each version of a
+        package, with a marker selecting all the pythons that froze it,
+        rather than a line per python.
     :return: A list of '\n' terminated lines for a requirements file.
     """
     packages = {}  # {package : {version : [py_version]}}
@@ -139,7 +811,11 @@ def _combine_freezes(freezes, denylist=None):
                 list(versions.values())[0] != reference_versions):
             # markers
             for version, py_versions in sorted(versions.items()):
-                # Once the ecosystem matures, we can consider using OR.
+                if compact:
+                    yield "%s===%s;%s\n" % (
+                        package, version,
+                        _compact_marker(py_versions, reference_versions))
+                    continue
                 for py_version in sorted(py_versions):
                     yield (
                         "%s===%s;python_version=='%s'\n" %
@@ -184,6 +860,12 @@ def _validate_options(options):
         raise Exception(
             "Denylist file %(path)s not found."
             % dict(path=options.denylist))
+    if options.venv_templates and utils.get_cache_dir() is None:
+        # The pythons of the templates get run, so they must not be kept
+        # in a shared directory such as /tmp instead.
+        raise Exception(
+            "--venv-templates needs a cache directory, but "
+            "OPENSTACK_REQUIREMENTS_CACHE_DIR is empty.")
     version_map = {}
     for map_entry in options.version_map:
         if ':' not in map_entry:
@@ -235,15 +917,81 @@ def main(argv=None, stdout=None):
               'This is intended as as a way to transition between python '
               'versions when it\'s not possible to have all versions '
               'installed'))
+    parser.add_option(
+        "-j", "--jobs", dest="jobs", type="int", default=1,
+        help="Number of Pythons to generate freezes for in parallel.")
+    parser.add_option(
+        "--venv-templates", dest="venv_templates", action="store_true",
+        default=False,
+        help="Clone each venv from a cached, already bootstrapped template "
+             "venv for the Python version instead of creating it from "
+             "scratch.")
+    parser.add_option(
+        "--wheelhouse", dest="wheelhouse", default=None,
+        help="Install only from the wheels in this directory, building any "
+             "that are missing into it first. Once it holds everything "
+             "needed, generating constraints does not use the network, and "
+             "the freezes are cached until the requirements, the Python or "
+             "the wheels of the packages frozen change.")
+    parser.add_option(
+        "--resolve-only", dest="resolve_only", action="store_true",
+        default=False,
+        help="Take the pinned versions from pip's resolver instead of "
+             "installing the requirements and freezing the result. Nothing "
+             "is built or installed beyond the venv's bootstrap packages.")
+    parser.add_option(
+        "--force", dest="force", action="store_true", default=False,
+        help="Freeze every Python even if an earlier run already froze the "
+             "same requirements with the same Python and wheelhouse.")
+    parser.add_option(
+        "--stats", dest="stats", default=None,
+        help="Write the time each phase of each freeze took, the peak RSS "
+             "of the commands run and, with --wheelhouse, the number of "
+             "wheels built and reused to this file as JSON.")
+    parser.add_option(
+        "--shard", dest="shard", action="store_true", default=False,
+        help="With --wheelhouse and --jobs, split the requirements into "
+             "shards that have no dependencies in common according to the "
+             "wheels, freeze the shards in parallel and merge them.")
+    parser.add_option(
+        "--compact-markers", dest="compact_markers", action="store_true",
+        default=False,
+        help="Write one line per version of a package, with a marker such "
+             "as python_version>='3.10' or python_version in '3.9 3.10' "
+             "covering every Python that froze it, instead of one line per "
+             "Python.")
     options, args = parser.parse_args(argv)
     if stdout is None:
         stdout = sys.stdout
     _validate_options(options)
-    freezes = [
-        _freeze(options.requirements, python) for python in options.pythons]
+    venv_templates = None
+    if options.venv_templates:
+        venv_templates = os.path.join(
+            utils.get_cache_dir(), 'venv-templates')
+    wheelhouse = None
+    if options.wheelhouse:
+        wheelhouse = os.path.abspath(options.wheelhouse)
+    cache_dir = utils.get_cache_dir()
+    if cache_dir is not None:
+        cache_dir = os.path.join(cache_dir, 'freezes')
+    stats = [] if options.stats else None
+    start = time.monotonic()
+    freezes = _freeze_all(
+        options.requirements, options.pythons, options.jobs,
+        cache_dir=cache_dir, force=options.force, stats=stats,
+        shard=options.shard,
+        venv_templates=venv_templates, wheelhouse=wheelhouse,
+        resolve_only=options.resolve_only)
+    if stats is not None:
+        with open(options.stats, 'wt') as f:
+            json.dump(
+                {'jobs': options.jobs, 'freezes': stats,
+                 'total': time.monotonic() - start},
+                f, indent=2, sort_keys=True)
     _clone_versions(freezes, options)
     denylist = _parse_denylist(options.denylist)
     frozen = [
-        *sorted(_combine_freezes(freezes, denylist), key=_make_sort_key)]
+        *sorted(_combine_freezes(freezes, denylist, options.compact_markers),
+                key=_make_sort_key)]
     stdout.writelines(frozen)
     stdout.flush()
@@ -12,77 +12,277 @@
 
 """Apply validation rules to the various requirements lists.
 
+Several branches can be validated in one run, either as triples of files
+or as git refs whose files are read straight from the object database.
+Each distinct file content is parsed once however many branches share it,
+and branches are validated in a process pool.
+
 """
 
 import argparse
+import hashlib
+import json
 import os
+import subprocess
 
 from openstack_requirements import constraints
-from openstack_requirements import requirement
-from openstack_requirements.utils import read_requirements_file
+from openstack_requirements import utils
+
+
+FILENAMES = (
+    'global-requirements.txt', 'upper-constraints.txt', 'denylist.txt')
+
+
+def _content_key(body):
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def read_refs(repo, refs):
+    """Read the files to validate at each of refs in the git repo.
+
+    Every file is fetched through one 'git cat-file --batch' process.
+
+    :return: A list of (ref, keys) pairs, with keys a tuple of the content
+        keys of FILENAMES at ref, and a dict of content key to content.
+    """
+    objects = ['%s:%s' % (ref, filename)
+               for ref in refs for filename in FILENAMES]
+    output = subprocess.run(
+        ['git', '-C', repo, 'cat-file', '--batch'],
+        input=''.join(o + '\n' for o in objects).encode('utf-8'),
+        stdout=subprocess.PIPE, check=True).stdout
+    contents = {}
+    keys = []
+    pos = 0
+    for obj in objects:
+        end = output.index(b'\n', pos)
+        header = output[pos:end].decode('utf-8').split()
+        if header[-1] == 'missing' or header[1] != 'blob':
+            raise Exception('Cannot read %s from %s' % (obj, repo))
+        size = int(header[2])
+        # Blob ids are hashes of the content already.
+        contents[header[0]] = output[end + 1:end + 1 + size].decode('utf-8')
+        keys.append(header[0])
+        pos = end + 1 + size + 1
+    branches = [
+        (ref, tuple(keys[i * len(FILENAMES):(i + 1) * len(FILENAMES)]))
+        for i, ref in enumerate(refs)
+    ]
+    return branches, contents
+
+
+def read_triples(paths):
+    """Read the files to validate from (gr, uc, denylist) path triples.
+
+    :return: As read_refs, with each branch named after its
+        upper-constraints file.
+    """
+    contents = {}
+    branches = []
+    for i in range(0, len(paths), len(FILENAMES)):
+        keys = []
+        for path in paths[i:i + len(FILENAMES)]:
+            with open(path, 'rt') as f:
+                body = f.read()
+            key = _content_key(body)
+            contents[key] = body
+            keys.append(key)
+        branches.append((paths[i + 1], tuple(keys)))
+    return branches, contents
+
+
+def validate_branch(parsed, keys, constraints_list_name, indexes=None):
+    """Validate one branch.
+
+    :param parsed: A dict of content key to parsed requirements.
+    :param keys: The content keys of the branch's FILENAMES.
+    :param indexes: A dict of content key to SpecifierIndex, shared between
+        branches with the same global-requirements.
+    :return: A list of constraints.Diagnostic.
+    """
+    global_key, constraints_key, denylist_key = keys
+    index = None
+    if indexes is not None:
+        index = indexes.get(global_key)
+        if index is None:
+            index = constraints.SpecifierIndex(parsed[global_key])
+            indexes[global_key] = index
+    return list(constraints.validate(
+        parsed[global_key], parsed[constraints_key], parsed[denylist_key],
+        constraints_list_name, index=index))
+
+
+def _validate_with_state(state, keys, constraints_list_name):
+    parsed, indexes = state
+    return validate_branch(parsed, keys, constraints_list_name, indexes)
+
+
+def validate_branches(branches, contents, jobs=None, list_name=None):
+    """Validate many branches, in parallel if jobs is not 1.
+
+    Each distinct file content is parsed once, and branches whose files are
+    all identical are only validated once.
 
+    :param branches: A list of (name, keys) pairs, as from read_refs.
+    :param contents: A dict of content key to file content.
+    :param list_name: A callable giving the constraints file name to use in
+        messages for a branch name.
+    :return: An iterator of (name, list of constraints.Diagnostic) pairs,
+        in the order of branches, each yielded as soon as the branch and
+        those before it are done.
+    """
+    if list_name is None:
+        def list_name(name):
+            return FILENAMES[1]
+    parsed = {key: utils.parse_requirements(body)
+              for key, body in contents.items()}
+    tasks = [(name, (keys, list_name(name))) for name, keys in branches]
+    unique = list(dict.fromkeys(task for _, task in tasks))
+    # Each worker process gets a copy of the empty indexes dict, and fills
+    # it in for the branches it validates.
+    done = zip(unique, utils.map_with_state(
+        _validate_with_state, (parsed, {}), unique, jobs))
+    results = {}
+    for name, task in tasks:
+        while task not in results:
+            finished, diagnostics = next(done)
+            results[finished] = diagnostics
+        yield name, results[task]
 
-def main():
+
+def _headers(files):
+    """Return the header of each check, given the branch's files' names."""
+    global_requirements, upper_constraints, denylist = files
+    return {
+        'format': 'Checking %s' % upper_constraints,
+        'compatible': 'Checking %s' % global_requirements,
+        'bounds': 'Checking requirements on %s' % global_requirements,
+        'uniform': ('Validating uniform formatting on %s' %
+                    global_requirements),
+        'denylist': 'Checking %s' % denylist,
+    }
+
+
+def _print_diagnostics(diagnostics, files):
+    """Print diagnostics under a header for each check, as they come.
+
+    :param files: The names of the branch's FILENAMES, for the headers.
+    :return: The list of diagnostics printed.
+    """
+    headers = _headers(files)
+    printed = []
+    for diagnostic in diagnostics:
+        if not printed or printed[-1].check != diagnostic.check:
+            print('\n%s' % headers[diagnostic.check])
+        print(diagnostic.message)
+        printed.append(diagnostic)
+    return printed
+
+
+def _print_checks(parsed, list_name, files):
+    """Run and print each check in turn, under its header.
+
+    Every header is printed, even for checks that find nothing.
+
+    :param parsed: The parsed FILENAMES of the branch.
+    :return: The list of diagnostics printed.
+    """
+    headers = _headers(files)
+    index = constraints.SpecifierIndex(parsed[0])
+    printed = []
+    for check in constraints.CHECKS:
+        print('\n%s' % headers[check])
+        for diagnostic in constraints.validate(
+                *parsed, list_name, index=index, checks=(check,)):
+            print(diagnostic.message)
+            printed.append(diagnostic)
+    return printed
+
+
+def main(args=None):
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        'global_requirements',
-        default='global-requirements.txt',
-        help='path to the global-requirements.txt file',
+        'files',
+        nargs='*',
+        metavar='global_requirements upper_constraints denylist',
+        help='paths to a global-requirements.txt, upper-constraints.txt '
+             'and denylist.txt to validate together; repeat for more '
+             'branches',
     )
     parser.add_argument(
-        'upper_constraints',
-        default='upper-constraints.txt',
-        help='path to the upper-constraints.txt file',
+        '-r', '--ref',
+        action='append',
+        default=[],
+        help='validate the files at this git ref; may be repeated',
     )
     parser.add_argument(
-        'denylist',
-        default='denylist.txt',
-        help='path to the denylist.txt file',
+        '--repo',
+        default='.',
+        help='the git repository to read --ref from',
     )
-    args = parser.parse_args()
-
-    error_count = 0
-
-    # Check the format of the constraints file.
-    print('\nChecking %s' % args.upper_constraints)
-    constraints_txt = read_requirements_file(args.upper_constraints)
-    for msg in constraints.check_format(constraints_txt):
-        print(msg)
-        error_count += 1
-
-    # Check that the constraints and requirements are compatible.
-    print('\nChecking %s' % args.global_requirements)
-    global_reqs = read_requirements_file(args.global_requirements)
-    for msg in constraints.check_compatible(global_reqs, constraints_txt):
-        print(msg)
-        error_count += 1
-
-    # Check requirements to satisfy policy.
-    print('\nChecking requirements on %s' % args.global_requirements)
-    for msg in requirement.check_reqs_bounds_policy(global_reqs):
-        print(msg)
-        error_count += 1
-
-    # Check that global requirements are uniformly formatted
-    print('\nValidating uniform formatting on %s' % args.global_requirements)
-    with open(args.global_requirements, 'rt') as f:
-        for line in f:
-            if line == '\n':
-                continue
-            req = requirement.parse_line(line)
-            normed_req = req.to_line(comment_prefix='  ', sort_specifiers=True)
-            if line.rstrip() != normed_req.rstrip():
-                print("-%s\n+%s" % (line.rstrip(), normed_req.rstrip()))
-                error_count += 1
-
-    # Check that all of the items in the global-requirements list
-    # appear in exactly one of the constraints file or the denylist.
-    print('\nChecking %s' % args.denylist)
-    denylist = read_requirements_file(args.denylist)
-    for msg in constraints.check_denylist_coverage(
-            global_reqs, constraints_txt, denylist,
-            os.path.basename(args.upper_constraints)):
-        print(msg)
-        error_count += 1
-
-    return 1 if error_count else 0
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=None,
+        help='number of worker processes (default: number of CPUs)',
+    )
+    parser.add_argument(
+        '-o', '--output',
+        default=None,
+        help='also write a JSON report of the errors of each branch here',
+    )
+    args = parser.parse_args(args)
+    if len(args.files) % len(FILENAMES):
+        parser.error('files must be given as global_requirements, '
+                     'upper_constraints, denylist triples')
+    if not args.files and not args.ref:
+        parser.error('nothing to validate')
+
+    branches, contents = read_triples(args.files)
+    if args.ref:
+        ref_branches, ref_contents = read_refs(args.repo, args.ref)
+        branches.extend(ref_branches)
+        contents.update(ref_contents)
+    paths = set(args.files[1::len(FILENAMES)])
+
+    def list_name(name):
+        if name in paths:
+            return os.path.basename(name)
+        return FILENAMES[1]
+
+    files = {}
+    for i in range(0, len(args.files), len(FILENAMES)):
+        files[args.files[i + 1]] = args.files[i:i + len(FILENAMES)]
+    for ref in args.ref:
+        files[ref] = ['%s:%s' % (ref, filename) for filename in FILENAMES]
+
+    report = {}
+    if len(branches) == 1:
+        # Nothing to share or run in parallel: stream the diagnostics.
+        name, keys = branches[0]
+        parsed = [utils.parse_requirements(contents[key]) for key in keys]
+        report[name] = _print_checks(parsed, list_name(name), files[name])
+    else:
+        for name, diagnostics in validate_branches(
+                branches, contents, args.jobs, list_name):
+            print('\nChecking %s' % name)
+            report[name] = _print_diagnostics(diagnostics, files[name])
+
+    failed = [name for name, _ in branches if report[name]]
+    if len(branches) > 1:
+        print('\nSummary:')
+        for name, _ in branches:
+            print('  %s: %s' % (
+                name, '%d errors' % len(report[name]) if report[name]
+                else 'OK'))
+    if args.output:
+        with open(args.output, 'wt') as f:
+            json.dump({
+                'failed': failed,
+                'branches': {
+                    name: [diagnostic._asdict() for diagnostic in errors]
+                    for name, errors in report.items()
+                },
+            }, f, indent=2, sort_keys=True)
+
+    return 1 if failed else 0
@@ -10,7 +10,9 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-from packaging import specifiers
+import collections
+
+from openstack_requirements import requirement
 
 
 # FIXME(dhellmann): These items were not in the constraints list but
@@ -54,13 +56,90 @@ def check_denylist_coverage(global_reqs, constraints, denylist,
                % (d, constraints_list_name))
 
 
+def _format_errors(name, spec_list):
+    """Yield the formatting errors of the constraints for one package."""
+    covered = set()
+    for req, original_line in spec_list:
+        if not req.specifiers.startswith('==='):
+            yield ('Invalid constraint for %s does not have 3 "=": %s' %
+                   (name, original_line))
+        if not req.markers or len(spec_list) == 1:
+            continue
+        try:
+            pythons = requirement.marker_python_versions(req.markers)
+        except Exception as exc:
+            yield ('Invalid marker for %s: %s: %s' %
+                   (name, original_line, exc))
+            continue
+        # With several lines for a package, the markers must pick a
+        # single line for each Python.
+        overlap = covered.intersection(pythons)
+        if overlap:
+            yield ('Constraints for %s overlap for python %s: %s' %
+                   (name, ', '.join(sorted(
+                       overlap, key=requirement.python_version_key)),
+                    original_line))
+        covered.update(pythons)
+
+
 def check_format(parsed_constraints):
     "Apply the formatting rules to the pre-parsed constraints."
     for name, spec_list in parsed_constraints.items():
-        for req, original_line in spec_list:
-            if not req.specifiers.startswith('==='):
-                yield ('Invalid constraint for %s does not have 3 "=": %s' %
-                       (name, original_line))
+        for msg in _format_errors(name, spec_list):
+            yield msg
+
+
+def uniform_format_error(req, original_line):
+    """Return a diff if original_line is not req in normal form, or None.
+
+    Global requirements are written with sorted specifiers and two spaces
+    before any comment.
+    """
+    normed = req.to_line(comment_prefix='  ', sort_specifiers=True)
+    if original_line.rstrip() != normed.rstrip():
+        return '-%s\n+%s' % (original_line.rstrip(), normed.rstrip())
+    return None
+
+
+class SpecifierIndex(object):
+    """Global requirements compiled for checking constraints against.
+
+    The specifiers of each package are parsed once, and the outcome for
+    each pinned version is remembered, so an index built once can check
+    any number of constraints files.
+    """
+
+    def __init__(self, global_reqs):
+        """Compile global_reqs, as returned by requirement.parse."""
+        self._specs = {
+            name: tuple((req.specifier_set, req.specifiers)
+                        for req, _ in reqs)
+            for name, reqs in global_reqs.items()
+        }
+        self._tried = {}
+
+    def check(self, name, version):
+        """Check version of the package name against its requirements.
+
+        :param version: A packaging Version, or a string if it is not a
+            valid version.
+        :return: None if any of the requirements for name allows version
+            (or there are none), otherwise the list of the specifiers
+            tried.
+        """
+        key = (requirement.canonical_name(name), version)
+        if key[0] not in self._specs:
+            return None
+        if key not in self._tried:
+            tried = []
+            for spec, specifiers in self._specs[key[0]]:
+                # pre-releases are allowed by policy but discouraged
+                if spec.contains(version, prereleases=True):
+                    tried = None
+                    break
+                tried.append(specifiers)
+            self._tried[key] = tried
+        return self._tried[key]
 
 
 def check_compatible(global_reqs, constraints):
@@ -82,27 +161,85 @@ def check_compatible(global_reqs, constraints):
          haven't yet implemented. Being compatible with one of the
          requirements is good enough proxy to catch most cases.
 
-    :param global_reqs: A set of global requirements after parsing.
+    :param global_reqs: A set of global requirements after parsing, or a
+        SpecifierIndex of them.
     :param constraints: The same from given constraints.txt.
     :return: A list of the error messages for constraints that failed.
     """
-    def satisfied(reqs, name, version, failures):
-        if name not in reqs:
-            return True
-        tested = []
-        for constraint, _ in reqs[name]:
-            spec = specifiers.SpecifierSet(constraint.specifiers)
-            # pre-releases are allowed by policy but discouraged
-            if spec.contains(version, prereleases=True):
-                return True
-            tested.append(constraint.specifiers)
-        failures.append('Constraint %s for %s does not match requirement %s' %
-                        (version, name, tested))
-        return False
+    if not isinstance(global_reqs, SpecifierIndex):
+        global_reqs = SpecifierIndex(global_reqs)
     failures = []
     for pkg_constraints in constraints.values():
         for constraint, _ in pkg_constraints:
-            name = constraint.package
-            version = constraint.specifiers[3:]
-            satisfied(global_reqs, name, version, failures)
+            msg = _compatibility_error(global_reqs, constraint)
+            if msg:
+                failures.append(msg)
     return failures
+
+
+def _compatibility_error(index, constraint):
+    version = constraint.specifiers[3:]
+    tried = index.check(
+        constraint.package, constraint.pinned_version or version)
+    if tried is None:
+        return None
+    return ('Constraint %s for %s does not match requirement %s' %
+            (version, constraint.package, tried))
+
+
+Diagnostic = collections.namedtuple('Diagnostic', ['check', 'name', 'message'])
+
+# Every check validate runs, in the order validate-constraints reports them.
+CHECKS = ('format', 'compatible', 'bounds', 'uniform', 'denylist')
+
+
+def validate(global_reqs, constraints, denylist,
+             constraints_list_name='upper-constraints.txt', index=None,
+             checks=CHECKS):
+    """Apply every validation rule to pre-parsed inputs.
+
+    This runs check_format, check_compatible, check_denylist_coverage,
+    requirement.check_reqs_bounds_policy and the uniform formatting check
+    of global-requirements, walking each input only once. Diagnostics are
+    yielded as soon as they are found.
+
+    :param global_reqs: Parsed global-requirements.txt.
+    :param constraints: Parsed constraints file.
+    :param denylist: Parsed denylist.txt.
+    :param constraints_list_name: The name of the constraints file, for
+        messages.
+    :param index: A SpecifierIndex of global_reqs, to reuse one built
+        earlier.
+    :param checks: The checks to run, out of CHECKS.
+    :return: An iterator of Diagnostic, whose check is one of checks.
+    """
+    if index is None and 'compatible' in checks:
+        index = SpecifierIndex(global_reqs)
+    for name, spec_list in constraints.items():
+        if 'format' in checks:
+            for msg in _format_errors(name, spec_list):
+                yield Diagnostic('format', name, msg)
+        if 'compatible' in checks:
+            for constraint, _ in spec_list:
+                msg = _compatibility_error(index, constraint)
+                if msg:
+                    yield Diagnostic('compatible', name, msg)
+        if 'denylist' in checks and name and name in denylist:
+            yield Diagnostic(
+                'denylist', name, '%r appears in both denylist.txt and %s'
+                % (name, constraints_list_name))
+    for name, reqs in global_reqs.items():
+        if 'bounds' in checks:
+            msg = requirement.bounds_policy_error(reqs[0][0])
+            if msg:
+                yield Diagnostic('bounds', name, msg)
+        if 'uniform' in checks:
+            for req, original_line in reqs:
+                msg = uniform_format_error(req, original_line)
+                if msg:
+                    yield Diagnostic('uniform', name, msg)
+        if ('denylist' in checks and name not in constraints and
+                name not in denylist and name not in UNCONSTRAINABLE):
+            yield Diagnostic(
+                'denylist', name, '%r appears in global-requirements.txt '
+                'but not %s or denylist.txt' % (name, constraints_list_name))
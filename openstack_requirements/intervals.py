@@ -0,0 +1,301 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Version specifiers as sets of version intervals.
+
+A specifier set such as '>=1.2,!=1.4,<2' is compiled into the sorted,
+disjoint intervals of versions it admits, here [1.2, 1.4) and (1.4, 2).
+Questions like "does every version the global list allows also satisfy this
+specifier" are then answered by walking interval bounds, without ever
+enumerating candidate versions.
+
+Versions are compared by plain PEP 440 ordering. The special cases PEP 440
+makes for pre-releases, post-releases and local versions next to an
+exclusive bound are not modelled.
+"""
+
+# This module has no IO at all, and none should be added.
+
+import collections
+import functools
+
+import packaging.specifiers
+import packaging.version
+
+
+# None for a bound means unbounded on that side.
+Interval = collections.namedtuple(
+    'Interval', ['lower', 'lower_closed', 'upper', 'upper_closed'])
+
+_EVERYTHING = Interval(None, False, None, False)
+
+
+def _lower_key(interval):
+    if interval.lower is None:
+        return (0,)
+    return (1, interval.lower, 0 if interval.lower_closed else 1)
+
+
+def _upper_key(interval):
+    if interval.upper is None:
+        return (2,)
+    return (1, interval.upper, 1 if interval.upper_closed else 0)
+
+
+def _is_empty(interval):
+    if interval.lower is None or interval.upper is None:
+        return False
+    if interval.lower != interval.upper:
+        return interval.lower > interval.upper
+    return not (interval.lower_closed and interval.upper_closed)
+
+
+def _is_before(a, b):
+    """Return True if a ends before b starts, without touching it."""
+    if a.upper is None or b.lower is None:
+        return False
+    if a.upper != b.lower:
+        return a.upper < b.lower
+    return not (a.upper_closed or b.lower_closed)
+
+
+def _intersect(a, b):
+    lower = max(a, b, key=_lower_key)
+    upper = min(a, b, key=_upper_key)
+    interval = Interval(
+        lower.lower, lower.lower_closed, upper.upper, upper.upper_closed)
+    return None if _is_empty(interval) else interval
+
+
+class VersionRange(object):
+    """The versions admitted by a specifier set.
+
+    intervals is a tuple of Intervals, sorted, non-empty and with no two of
+    them overlapping or touching. Construct instances with from_specifiers
+    rather than directly.
+    """
+
+    __slots__ = ('intervals',)
+
+    def __init__(self, intervals=(_EVERYTHING,)):
+        merged = []
+        for interval in sorted(
+                (i for i in intervals if not _is_empty(i)), key=_lower_key):
+            if merged and not _is_before(merged[-1], interval):
+                last = merged.pop()
+                upper = max(last, interval, key=_upper_key)
+                interval = Interval(
+                    last.lower, last.lower_closed,
+                    upper.upper, upper.upper_closed)
+            merged.append(interval)
+        self.intervals = tuple(merged)
+
+    def __eq__(self, other):
+        return (isinstance(other, VersionRange) and
+                self.intervals == other.intervals)
+
+    def __hash__(self):
+        return hash(self.intervals)
+
+    def __repr__(self):
+        return 'VersionRange(%r)' % (self.intervals,)
+
+    def __str__(self):
+        if not self.intervals:
+            return '{}'
+        parts = []
+        for interval in self.intervals:
+            parts.append('%s%s, %s%s' % (
+                '[' if interval.lower_closed else '(',
+                '-inf' if interval.lower is None else interval.lower,
+                'inf' if interval.upper is None else interval.upper,
+                ']' if interval.upper_closed else ')'))
+        return ' u '.join(parts)
+
+    def is_empty(self):
+        """Return True if no version at all is admitted."""
+        return not self.intervals
+
+    def intersection(self, other):
+        """Return the VersionRange of versions admitted by both ranges."""
+        result = []
+        a, b = self.intervals, other.intervals
+        i = j = 0
+        while i < len(a) and j < len(b):
+            interval = _intersect(a[i], b[j])
+            if interval is not None:
+                result.append(interval)
+            if _upper_key(a[i]) < _upper_key(b[j]):
+                i += 1
+            else:
+                j += 1
+        return VersionRange(result)
+
+    def issubset(self, other):
+        """Return True if every version admitted here is admitted by other.
+
+        As other's intervals neither overlap nor touch, each interval here
+        has to fit inside a single one of them.
+        """
+        theirs = other.intervals
+        j = 0
+        for interval in self.intervals:
+            while (j < len(theirs) and
+                   _upper_key(theirs[j]) < _upper_key(interval)):
+                j += 1
+            if j == len(theirs):
+                return False
+            if _lower_key(theirs[j]) > _lower_key(interval):
+                return False
+        return True
+
+    def hull(self):
+        """Return the smallest single Interval holding the range, or None.
+
+        None is returned for the empty range.
+        """
+        if not self.intervals:
+            return None
+        first, last = self.intervals[0], self.intervals[-1]
+        return Interval(
+            first.lower, first.lower_closed, last.upper, last.upper_closed)
+
+    def lowest(self):
+        """Return the lowest admissible version, or None.
+
+        None is returned when nothing is admitted, when there is no lower
+        bound, and when the lower bound itself is excluded (as in '>1.0'),
+        since no single version is then the lowest.
+        """
+        if not self.intervals:
+            return None
+        first = self.intervals[0]
+        return first.lower if first.lower_closed else None
+
+    def __contains__(self, version):
+        if not isinstance(version, packaging.version.Version):
+            version = packaging.version.Version(version)
+        point = VersionRange([Interval(version, True, version, True)])
+        return point.issubset(self)
+
+
+def _prefix_bounds(prefix):
+    """Return the range of versions matched by 'prefix.*', as a pair.
+
+    The lower bound is closed and the upper one open.
+    """
+    version = packaging.version.Version(prefix)
+    release = list(version.release)
+    release[-1] += 1
+    epoch = '%d!' % version.epoch if version.epoch else ''
+    upper = epoch + '.'.join(str(part) for part in release)
+    return (packaging.version.Version(prefix + '.dev0'),
+            packaging.version.Version(upper + '.dev0'))
+
+
+def _compile_specifier(spec):
+    """Return the Intervals admitted by a single packaging Specifier."""
+    operator, version = spec.operator, spec.version
+    if operator == '===':
+        raise ValueError(
+            'Arbitrary equality %r compares strings, not versions' % str(spec))
+    if version.endswith('.*'):
+        lower, upper = _prefix_bounds(version[:-2])
+        if operator == '==':
+            return [Interval(lower, True, upper, False)]
+        return [Interval(None, False, lower, False),
+                Interval(upper, True, None, False)]
+    parsed = packaging.version.Version(version)
+    if operator == '==':
+        return [Interval(parsed, True, parsed, True)]
+    if operator == '!=':
+        return [Interval(None, False, parsed, False),
+                Interval(parsed, False, None, False)]
+    if operator == '>=':
+        return [Interval(parsed, True, None, False)]
+    if operator == '>':
+        return [Interval(parsed, False, None, False)]
+    if operator == '<=':
+        return [Interval(None, False, parsed, True)]
+    if operator == '<':
+        return [Interval(None, False, parsed, False)]
+    if operator == '~=':
+        # Suffixes such as .post3 are not part of the prefix.
+        prefix = '.'.join(str(part) for part in parsed.release[:-1])
+        if parsed.epoch:
+            prefix = '%d!%s' % (parsed.epoch, prefix)
+        upper = _prefix_bounds(prefix)[1]
+        return [Interval(parsed, True, upper, False)]
+    raise ValueError('Unknown specifier operator %r' % operator)
+
+
+def _exclusion(spec):
+    """Return the single Interval a '!=' specifier excludes."""
+    if spec.version.endswith('.*'):
+        lower, upper = _prefix_bounds(spec.version[:-2])
+        return Interval(lower, True, upper, False)
+    parsed = packaging.version.Version(spec.version)
+    return Interval(parsed, True, parsed, True)
+
+
+def compile_specifier_set(specifier_set):
+    """Compile a packaging SpecifierSet into a VersionRange.
+
+    Every specifier other than '!=' admits a single interval, so those are
+    intersected into one interval first. The '!=' exclusions are then sorted
+    and cut out of it in one sweep, which keeps the whole compilation at
+    O(k log k) for k specifiers.
+
+    :raises ValueError: For '===' specifiers, which match version strings
+        exactly and so cannot be expressed as intervals of versions.
+    """
+    hull = _EVERYTHING
+    excluded = []
+    for spec in specifier_set:
+        if spec.operator == '!=':
+            excluded.append(_exclusion(spec))
+            continue
+        hull = _intersect(hull, _compile_specifier(spec)[0])
+        if hull is None:
+            return VersionRange(())
+    # Merge the exclusions, then keep the gaps between them.
+    pieces = []
+    remaining = hull
+    for gap in VersionRange(excluded).intervals:
+        before = Interval(
+            remaining.lower, remaining.lower_closed,
+            gap.lower, not gap.lower_closed)
+        if gap.lower is not None:
+            before = _intersect(before, remaining)
+            if before is not None:
+                pieces.append(before)
+        if gap.upper is None:
+            remaining = None
+            break
+        remaining = _intersect(
+            remaining, Interval(gap.upper, not gap.upper_closed, None, False))
+        if remaining is None:
+            break
+    if remaining is not None:
+        pieces.append(remaining)
+    return VersionRange(pieces)
+
+
+@functools.lru_cache(maxsize=4096)
+def from_specifiers(specifiers):
+    """Return the VersionRange for a comma separated specifiers string.
+
+    Results are cached and shared between callers; VersionRange objects are
+    never modified in place.
+    """
+    return compile_specifier_set(
+        packaging.specifiers.SpecifierSet(specifiers))
@@ -15,10 +15,11 @@
 # This module has no IO at all, and none should be added.
 
 import collections
-import distutils.version
+import functools
 import packaging.specifiers
-import pkg_resources
+import packaging.version
 import re
+import sys
 
 
 # A header for the requirements file(s).
@@ -32,23 +33,125 @@ _REQS_HEADER = [
 ]
 
 
+_loose_version_re = re.compile(r'(\d+ | [a-z]+ | \.)', re.VERBOSE)
+
+
+def _loose_version(vstring):
+    """Split vstring the way distutils' LooseVersion does.
+
+    This keeps the specifier ordering of the deprecated LooseVersion class
+    without paying for importing distutils.
+    """
+    components = [x for x in _loose_version_re.split(vstring)
+                  if x and x != '.']
+    for i, obj in enumerate(components):
+        try:
+            components[i] = int(obj)
+        except ValueError:
+            pass
+    return components
+
+
 def key_specifier(a):
     weight = {'>=': 0, '>': 0,
               '===': 1, '==': 1, '~=': 1, '!=': 1,
               '<': 2, '<=': 2}
     a = a._spec
-    return (weight[a[0]], distutils.version.LooseVersion(a[1]))
+    return (weight[a[0]], _loose_version(a[1]))
+
+
+@functools.lru_cache(maxsize=4096)
+def _specifier_set(specifiers):
+    return packaging.specifiers.SpecifierSet(specifiers)
+
+
+@functools.lru_cache(maxsize=4096)
+def _version(version):
+    return packaging.version.Version(version)
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_marker(markers):
+    """Return the packaging Marker for the markers string.
+
+    Results are cached and shared between callers, so they must not be
+    modified.
+    """
+    # Imported here to keep the import cost of the console scripts down.
+    import packaging.markers
+
+    return packaging.markers.Marker(markers)
+
+
+# The Python versions considered when a marker is turned into the set of
+# Pythons it holds for. 3.1 to 3.5 are left out: besides being long dead,
+# "python_version in '3.10 3.11'" is a substring test and holds for 3.1.
+PYTHON_VERSIONS = ('2.7',) + tuple('3.%d' % minor for minor in range(6, 30))
+
+
+def python_version_key(version):
+    """Sort key for X.Y Python versions, putting 3.9 before 3.10."""
+    return tuple(int(part) for part in version.split('.'))
+
+
+@functools.lru_cache(maxsize=1024)
+def marker_python_versions(markers):
+    """Return the PYTHON_VERSIONS for which the markers string holds.
+
+    Variables other than python_version take their values from the running
+    interpreter.
+    """
+    marker = parse_marker(markers)
+    return frozenset(
+        version for version in PYTHON_VERSIONS
+        if marker.evaluate({'python_version': version}))
 
 
 class Requirement(collections.namedtuple('Requirement',
                                          ['package', 'location', 'specifiers',
                                           'markers', 'comment', 'extras'])):
+    """A single parsed requirements line.
+
+    This is still a plain tuple of strings, but the parsed forms of the
+    specifiers and markers are available as properties. Those are built
+    once per distinct string and shared, since the same specifiers turn up
+    in many requirements. Treat them as read-only.
+    """
+
+    __slots__ = ()
+
     def __new__(cls, package, location, specifiers, markers, comment,
                 extras=None):
         return super(Requirement, cls).__new__(
-            cls, package, location, specifiers, markers, comment,
+            cls, sys.intern(package), location, specifiers, markers, comment,
             frozenset(extras or ()))
 
+    @property
+    def specifier_set(self):
+        """The specifiers as a packaging SpecifierSet."""
+        return _specifier_set(self.specifiers)
+
+    @property
+    def pinned_version(self):
+        """The Version pinned by a '===' constraint, or None.
+
+        None is also returned when the pinned version is not a valid PEP 440
+        version, as '===' permits arbitrary strings.
+        """
+        if not self.specifiers.startswith('===') or ',' in self.specifiers:
+            return None
+        try:
+            return _version(self.specifiers[3:])
+        except packaging.version.InvalidVersion:
+            return None
+
+    @property
+    def marker(self):
+        """The markers as a packaging Marker, or None if there are none."""
+        if not self.markers:
+            return None
+        return parse_marker(self.markers)
+
     def to_line(self, marker_sep=';', line_prefix='', comment_prefix=' ',
                 sort_specifiers=False):
         comment_p = comment_prefix if self.package else ''
@@ -59,8 +162,7 @@ class Requirement(collections.namedtuple('Requirement',
         extras = '[%s]' % ",".join(sorted(self.extras)) if self.extras else ''
         specifiers = self.specifiers
         if sort_specifiers:
-            _specifiers = packaging.specifiers.SpecifierSet(specifiers)
-            _specifiers = ['%s' % s for s in sorted(_specifiers,
+            _specifiers = ['%s' % s for s in sorted(self.specifier_set,
                                                     key=key_specifier)]
             specifiers = ','.join(_specifiers)
         return '%s%s%s%s%s%s\n' % (location,
@@ -79,9 +181,184 @@ url_re = re.compile(
     r'#egg=(?P<name>[-\.\w]+)')
 
 
+# The fast path below understands the requirement shapes that make up almost
+# all of global-requirements.txt and upper-constraints.txt:
+#
+#   name[extra,extra] <op><version>, <op><version>
+#
+# Anything it does not recognise is handed to packaging, so it only has to be
+# conservative, not complete.
+_fast_req_re = re.compile(
+    r'^\s*(?P<name>[A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?)\s*'
+    r'(?:\[(?P<extras>[^\[\]]*)\])?\s*'
+    r'(?P<specs>[<>=!~].*?)?\s*$')
+_fast_extra_re = re.compile(
+    r'^[A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?$')
+_fast_spec_re = re.compile(
+    r'^\s*(?P<op>~=|===|==|!=|<=|>=|<|>)\s*'
+    r'(?P<release>[0-9]+(?:\.[0-9]+)*)'
+    r'(?:(?P<pre_l>a|b|rc)(?P<pre_n>[0-9]+))?'
+    r'(?:\.post(?P<post>[0-9]+))?'
+    r'(?:\.dev(?P<dev>[0-9]+))?'
+    r'(?P<wildcard>\.\*)?\s*$')
+_safe_name_re = re.compile(r'[^A-Za-z0-9.]+')
+_safe_extra_re = re.compile(r'[^A-Za-z0-9.-]+')
+
+
+def _fast_specifier(spec):
+    """Parse a single simple specifier.
+
+    :return: A (text, canonical_key) tuple, or None if spec is not simple.
+    """
+    m = _fast_spec_re.match(spec)
+    if m is None:
+        return None
+    op = m.group('op')
+    release = m.group('release')
+    if m.group('wildcard'):
+        if op not in ('==', '!=') or m.group('pre_l') or m.group('post') \
+                or m.group('dev'):
+            return None
+    elif op == '~=' and '.' not in release:
+        return None
+    text = spec.strip()
+    text = op + text[len(op):].lstrip()
+    # Mirror the equality packaging uses for specifiers (trailing zeros in
+    # the release are not significant) so duplicates are detected.
+    numbers = [int(n) for n in release.split('.')]
+    while len(numbers) > 1 and numbers[-1] == 0:
+        numbers.pop()
+    key = (op, tuple(numbers), m.group('pre_l'),
+           m.group('pre_n') and int(m.group('pre_n')),
+           m.group('post') and int(m.group('post')),
+           m.group('dev') and int(m.group('dev')),
+           bool(m.group('wildcard')))
+    return text, key
+
+
+def _parse_requirement_fast(req_line):
+    """Parse the common requirement shapes without packaging.
+
+    :return: A (project_name, extras, specifier) tuple identical to what
+        _parse_requirement_slow returns, or None if the line needs the full
+        parser.
+    """
+    m = _fast_req_re.match(req_line)
+    if m is None:
+        return None
+    extras = ()
+    if m.group('extras') is not None:
+        extras = [e.strip() for e in m.group('extras').split(',')]
+        if not all(_fast_extra_re.match(e) for e in extras):
+            return None
+        extras = tuple(
+            _safe_extra_re.sub('_', e).lower() for e in extras)
+    specs = {}
+    if m.group('specs'):
+        spec_list = m.group('specs').split(',')
+        if len(spec_list) > 1 and '===' in m.group('specs'):
+            # An arbitrary equality version runs up to the next whitespace,
+            # commas included, so leave those to the full parser.
+            return None
+        for spec in spec_list:
+            parsed = _fast_specifier(spec)
+            if parsed is None:
+                return None
+            text, key = parsed
+            if specs.setdefault(key, text) != text:
+                # packaging would keep an arbitrary one of these.
+                return None
+    name = safe_name(m.group('name'))
+    return name, extras, ','.join(sorted(specs.values()))
+
+
+def _parse_requirement_slow(req_line):
+    # Imported here as the fast path handles nearly every line, and the
+    # console scripts should not pay for the full parser at startup.
+    from packaging import requirements
+
+    parsed = requirements.Requirement(req_line)
+    extras = tuple(_safe_extra_re.sub('_', e).lower() for e in parsed.extras)
+    return safe_name(parsed.name), extras, str(parsed.specifier)
+
+
+def safe_name(req_name):
+    """Convert an arbitrary string to a standard distribution name."""
+    return _safe_name_re.sub('-', req_name)
+
+
 def canonical_name(req_name):
     """Return the canonical form of req_name."""
-    return pkg_resources.safe_name(req_name).lower()
+    return safe_name(req_name).lower()
+
+
+class ParseCache(object):
+    """A bounded LRU cache of parse_line results.
+
+    The same requirement lines turn up over and over again across the
+    projects we check, so we remember the Requirement parsed for each
+    (line, permit_urls) pair. Requirement objects are immutable, so the
+    cached values can be shared freely. Lines which fail to parse are not
+    cached and will raise again on every lookup.
+    """
+
+    def __init__(self, maxsize=8192):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, req_line, permit_urls=False):
+        key = (req_line, permit_urls)
+        try:
+            req = self._entries[key]
+        except KeyError:
+            pass
+        else:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return req
+        self.misses += 1
+        req = parse_line(req_line, permit_urls=permit_urls)
+        if self.maxsize > 0:
+            self._entries[key] = req
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return req
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
+
+
+# Shared by every caller in the process.
+_parse_cache = ParseCache()
+
+
+def cached_parse_line(req_line, permit_urls=False):
+    """Like parse_line, but served from the process-wide parse cache."""
+    return _parse_cache.get(req_line, permit_urls=permit_urls)
+
+
+def parse_cache_stats():
+    """Return the hit/miss/eviction counters of the process-wide cache."""
+    return _parse_cache.stats()
 
 
 def parse(content, permit_urls=False):
@@ -127,7 +404,7 @@ def parse_line(req_line, permit_urls=False):
                 hash_pos = hash_pos + parse_start
         else:
             # Trigger an early failure before we look for ':'
-            pkg_resources.Requirement.parse(req_line)
+            _parse_requirement_slow(req_line)
     else:
         parse_start = 0
         location = ''
@@ -149,10 +426,10 @@ def parse_line(req_line, permit_urls=False):
         specifier = ''
     elif req_line:
         # Pulled out a requirement
-        parsed = pkg_resources.Requirement.parse(req_line)
-        name = parsed.project_name
-        extras = parsed.extras
-        specifier = str(parsed.specifier)
+        parsed = _parse_requirement_fast(req_line)
+        if parsed is None:
+            parsed = _parse_requirement_slow(req_line)
+        name, extras, specifier = parsed
     else:
         # Comments / blank lines etc.
         name = ''
@@ -195,7 +472,22 @@ def to_reqs(content, permit_urls=False):
         if _pass_through(req_line, permit_urls=permit_urls):
             yield None, content_line
         else:
-            yield parse_line(req_line, permit_urls=permit_urls), content_line
+            yield (cached_parse_line(req_line, permit_urls=permit_urls),
+                   content_line)
+
+
+def bounds_policy_error(req):
+    """Return why the global requirement req breaks the policy, or None.
+
+    See check_reqs_bounds_policy for the policy.
+    """
+    if not req.package:
+        return None
+    for spec in req.specifier_set:
+        if spec.operator == '>=':
+            return ('Requirement %s should not include a >= specifier' %
+                    req.package)
+    return None
 
 
 def check_reqs_bounds_policy(global_reqs):
@@ -208,13 +500,6 @@ def check_reqs_bounds_policy(global_reqs):
     """
 
     for pkg_requirement in global_reqs.values():
-        req = pkg_requirement[0][0]
-        if req.package:
-            _specifiers = packaging.specifiers.SpecifierSet(req.specifiers)
-            lower_bound = set()
-            for spec in _specifiers:
-                if spec.operator == '>=':
-                    lower_bound.add(spec)
-            if len(lower_bound):
-                yield ('Requirement %s should not include a >= specifier' %
-                       req.package)
+        error = bounds_policy_error(pkg_requirement[0][0])
+        if error:
+            yield error
@@ -12,6 +12,7 @@
 
 import os.path
 import shutil
+import zipfile
 
 import fixtures
 
@@ -84,6 +85,20 @@ class GlobalRequirements(fixtures.Fixture):
             self.denylist_file)
 
 
+class CacheDir(fixtures.Fixture):
+    """Keep the parsed snapshots of a test in a private directory.
+
+    Without this, commands under test would write to the cache of the user
+    running the tests.
+    """
+
+    def setUp(self):
+        super(CacheDir, self).setUp()
+        self.path = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.EnvironmentVariable(
+            'OPENSTACK_REQUIREMENTS_CACHE_DIR', self.path))
+
+
 # Static data for unit testing.
 def make_project(fixture):
     with fixture:
@@ -101,3 +116,44 @@ pbr_project = make_project(pbr_fixture)
 project_project = make_project(project_fixture)
 bad_project = make_project(bad_project_fixture)
 oslo_project = make_project(oslo_fixture)
+
+
+def make_checkout(root, name, requirements):
+    """Write a project checkout holding only a requirements.txt.
+
+    :param root: The directory to create the checkout under.
+    :return: The path to the checkout.
+    """
+    path = os.path.join(root, name)
+    os.mkdir(path)
+    with open(os.path.join(path, 'requirements.txt'), 'w') as f:
+        f.write(requirements)
+    return path
+
+
+def make_wheel(directory, name, version, requires=()):
+    """Write a minimal pure python wheel for name into directory.
+
+    :param requires: Requires-Dist strings for its metadata.
+    :return: The path to the wheel.
+    """
+    dist_info = '%s-%s.dist-info' % (name, version)
+    files = {
+        '%s/__init__.py' % name: '',
+        dist_info + '/METADATA': (
+            'Metadata-Version: 2.1\nName: %s\nVersion: %s\n'
+            % (name, version) +
+            ''.join('Requires-Dist: %s\n' % r for r in requires)),
+        dist_info + '/WHEEL': (
+            'Wheel-Version: 1.0\nGenerator: test\n'
+            'Root-Is-Purelib: true\nTag: py3-none-any\n'),
+    }
+    files[dist_info + '/RECORD'] = ''.join(
+        '%s,,\n' % f for f in list(files) + [dist_info + '/RECORD'])
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(
+        directory, '%s-%s-py3-none-any.whl' % (name, version))
+    with zipfile.ZipFile(path, 'w') as whl:
+        for filename, content in files.items():
+            whl.writestr(filename, content)
+    return path
@@ -0,0 +1,57 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import importlib.util
+import os.path
+
+import testtools
+
+
+def _load_cap():
+    # tools/ is not a package, so load the script by path.
+    path = os.path.join(
+        os.path.dirname(__file__), '..', '..', 'tools', 'cap.py')
+    spec = importlib.util.spec_from_file_location('cap', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+cap = _load_cap()
+
+
+class TestCap(testtools.TestCase):
+
+    def test_cap(self):
+        frozen = cap.freeze(['six==1.10.0', 'lxml==3.7.3', '# comment'])
+        self.assertEqual(
+            ['six>=1.9.0,<=1.10.0 # MIT', 'lxml<4', 'pbr>=2.0', '# comment'],
+            cap.cap(['six>=1.9.0 # MIT', 'lxml<4', 'pbr>=2.0', '# comment'],
+                    frozen))
+
+    def test_name_separators(self):
+        frozen = cap.freeze(['python-novaclient==2.0'])
+        self.assertEqual(
+            ['python_novaclient>=1.0,<=2.0'],
+            cap.cap(['python_novaclient>=1.0'], frozen))
+        frozen = cap.freeze(['python_novaclient==2.0'])
+        self.assertEqual(
+            ['python-novaclient>=1.0,<=2.0'],
+            cap.cap(['python-novaclient>=1.0'], frozen))
+
+    def test_override(self):
+        self.addCleanup(cap.overrides.clear)
+        cap.overrides['libvirt-python'] = 'libvirt-python==1.0'
+        self.assertEqual(
+            ['libvirt-python==1.0'],
+            cap.cap(['libvirt_python>=0.9'],
+                    cap.freeze(['libvirt-python==2.0'])))
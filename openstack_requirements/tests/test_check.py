@@ -10,6 +10,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import io
+import pickle
 import textwrap
 
 from openstack_requirements import check
@@ -180,6 +182,193 @@ class TestIsReqInGlobalReqs(testtools.TestCase):
             )
         )
 
+    def test_equivalent_exclusion(self):
+        """Test that exclusions are compared by the versions they exclude."""
+        req = requirement.parse('name>=1.2,!=1.4.0')['name'][0][0]
+        self.assertTrue(
+            check._is_requirement_in_global_reqs(
+                req,
+                self.global_reqs['name'],
+                self.backports,
+            )
+        )
+
+    def test_cap_covered_by_global_exclusion(self):
+        """Test a cap excluding only versions global already excludes."""
+        global_reqs = check.get_global_reqs('name>=1.2,<2.0\n')
+        req = requirement.parse('name>=1.2,<3.0,!=2.5')['name'][0][0]
+        self.assertTrue(
+            check._is_requirement_in_global_reqs(
+                req, global_reqs['name'], self.backports))
+        req = requirement.parse('name>=1.2,<1.9')['name'][0][0]
+        self.assertFalse(
+            check._is_requirement_in_global_reqs(
+                req, global_reqs['name'], self.backports))
+        self.stdout.seek(0)
+        self.assertIn("Unexpected     : {'<1.9'}", self.stdout.read())
+
+
+class TestRequirementsList(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.useFixture(fixtures.MonkeyPatch(
+            'sys.stdout', self.useFixture(
+                fixtures.StringStream('stdout')).stream))
+        project_data = {
+            'requirements': {
+                'requirements.txt': 'name>=1.2\nother>=1.0\n',
+                'test-requirements.txt': 'name>=1.3\ntest-only\n',
+            },
+        }
+        self.reqs = check.RequirementsList('testproj', project_data)
+        self.reqs.process(False)
+
+    def _specifiers(self, name):
+        return [r.specifiers for r in self.reqs.reqs[name]]
+
+    def test_merged(self):
+        self.assertEqual(
+            set(['name', 'other', 'test-only']), set(self.reqs.reqs))
+        # The later file wins.
+        self.assertEqual(['>=1.3'], self._specifiers('name'))
+
+    def test_merged_is_cached(self):
+        self.assertEqual(self.reqs.reqs, self.reqs.reqs)
+        self.assertIs(self.reqs.reqs['name'], self.reqs.reqs['name'])
+
+    def test_files_for(self):
+        self.assertEqual(
+            ('requirements.txt', 'test-requirements.txt'),
+            self.reqs.files_for('name'))
+        self.assertEqual(('requirements.txt',), self.reqs.files_for('other'))
+        self.assertEqual((), self.reqs.files_for('missing'))
+
+    def test_add_file(self):
+        self.reqs.reqs  # build the merged view
+        self.reqs.reqs_by_file['doc/requirements.txt'] = (
+            self.reqs.extract_reqs('name>=1.4\n', False))
+        self.assertEqual(['>=1.4'], self._specifiers('name'))
+        self.assertEqual(3, len(self.reqs.files_for('name')))
+
+    def test_replace_file(self):
+        self.reqs.reqs
+        self.reqs.reqs_by_file['test-requirements.txt'] = (
+            self.reqs.extract_reqs('test-only\n', False))
+        self.assertEqual(['>=1.2'], self._specifiers('name'))
+        self.assertEqual(('requirements.txt',), self.reqs.files_for('name'))
+
+    def test_remove_file(self):
+        self.reqs.reqs
+        del self.reqs.reqs_by_file['test-requirements.txt']
+        self.assertNotIn('test-only', self.reqs.reqs)
+        self.reqs.reqs_by_file.pop('requirements.txt')
+        self.assertEqual({}, dict(self.reqs.reqs))
+
+    def test_assign(self):
+        self.reqs.reqs
+        self.reqs.reqs_by_file = {}
+        self.assertEqual({}, dict(self.reqs.reqs))
+        self.assertEqual((), self.reqs.files_for('name'))
+
+    def test_invalidate(self):
+        self.reqs.reqs
+        self.reqs.reqs_by_file['requirements.txt']['added'] = set()
+        self.assertNotIn('added', self.reqs.reqs)
+        self.reqs.invalidate()
+        self.assertIn('added', self.reqs.reqs)
+
+
+class TestGlobalRequirementSet(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.useFixture(fixtures.MonkeyPatch(
+            'sys.stdout', self.useFixture(
+                fixtures.StringStream('stdout')).stream))
+        self.global_reqs = check.get_global_reqs(textwrap.dedent("""
+        name>=1.2,!=1.4
+        withmarker>=1.5;python_version=='3.5'
+        withmarker>=1.2,!=1.4;python_version=='2.7'
+        """))
+
+    def _req(self, line):
+        return requirement.parse_line(line)
+
+    def test_still_a_set(self):
+        entries = self.global_reqs['withmarker']
+        self.assertEqual(2, len(entries))
+        self.assertEqual(
+            set(r for r, _ in requirement.parse(
+                "withmarker>=1.5;python_version=='3.5'\n"
+                "withmarker>=1.2,!=1.4;python_version=='2.7'\n"
+            )['withmarker']),
+            entries)
+
+    def test_exact_match(self):
+        entries = self.global_reqs['withmarker']
+        match = entries.find_match(
+            self._req("withmarker;python_version=='2.7'"), [])
+        self.assertEqual("python_version=='2.7'", match.markers)
+        self.assertEqual(frozenset(['!=1.4']), entries.exclusions(match))
+
+    def test_no_match(self):
+        self.assertIsNone(self.global_reqs['withmarker'].find_match(
+            self._req('withmarker'), []))
+
+    def test_python3_only_match(self):
+        match = self.global_reqs['withmarker'].find_match(
+            self._req('withmarker'), [], allow_3_only=True)
+        self.assertEqual("python_version=='3.5'", match.markers)
+
+    def test_local_python3_marker_match(self):
+        match = self.global_reqs['name'].find_match(
+            self._req("name;python_version>='3.6'"), [], allow_3_only=True)
+        self.assertEqual('', match.markers)
+
+    def test_backport_match(self):
+        match = self.global_reqs['name'].find_match(
+            self._req("name;python_version<'3.9'"), ['name'])
+        self.assertEqual('', match.markers)
+
+    def test_pickle(self):
+        entries = self.global_reqs['withmarker']
+        copied = pickle.loads(pickle.dumps(entries))
+        self.assertEqual(entries, copied)
+        self.assertIsNotNone(copied.find_match(
+            self._req("withmarker;python_version=='3.5'"), []))
+
+
+class TestMarkerCache(testtools.TestCase):
+
+    def test_evaluate(self):
+        env = check._python_environment('3.8')
+        self.assertEqual((('python_version', '3.8'),), env)
+        self.assertTrue(
+            check._evaluate_marker("python_version>='3.6'", env))
+        self.assertFalse(
+            check._evaluate_marker("python_version<'3.6'", env))
+
+    def test_evaluate_cached(self):
+        env = check._python_environment('3.8')
+        check._evaluate_marker("python_version=='3.8'", env)
+        hits = check._evaluate_marker.cache_info().hits
+        check._evaluate_marker("python_version=='3.8'", env)
+        self.assertEqual(hits + 1, check._evaluate_marker.cache_info().hits)
+
+    def test_marker_environments(self):
+        self.assertEqual(
+            ((('python_version', '3.8'),),),
+            check._marker_environments("python_version=='3.8'"))
+
+    def test_marker_environments_compact(self):
+        self.assertEqual(
+            ((('python_version', '3.9'),), (('python_version', '3.10'),)),
+            check._marker_environments("python_version in '3.9 3.10'"))
+        self.assertEqual(
+            (('python_version', '3.28'),),
+            check._marker_environments("python_version>='3.10'")[-2])
+
 
 class TestGetExclusions(testtools.TestCase):
 
@@ -672,6 +861,82 @@ class TestValidateLowerConstraints(testtools.TestCase):
             )
         )
 
+    def test_lower_bound_highest_minimum(self):
+        constraints_content = textwrap.dedent("""
+        name==1.3.0
+        """)
+        project_data = {
+            'requirements': {'requirements.txt': 'name>=1.2,>=1.3'},
+            'lower-constraints.txt': constraints_content,
+        }
+        head_reqs = check.RequirementsList('testproj', project_data)
+        head_reqs.process(False)
+        self.assertFalse(
+            check.validate_lower_constraints(
+                req_list=head_reqs,
+                constraints=project_data['lower-constraints.txt'],
+                denylist=requirement.parse(''),
+            )
+        )
+
+    def test_lower_bound_compatible_release(self):
+        constraints_content = textwrap.dedent("""
+        name==1.3
+        """)
+        project_data = {
+            'requirements': {'requirements.txt': 'name~=1.2'},
+            'lower-constraints.txt': constraints_content,
+        }
+        head_reqs = check.RequirementsList('testproj', project_data)
+        head_reqs.process(False)
+        self.assertTrue(
+            check.validate_lower_constraints(
+                req_list=head_reqs,
+                constraints=project_data['lower-constraints.txt'],
+                denylist=requirement.parse(''),
+            )
+        )
+
+    def test_lower_bound_exclusive(self):
+        constraints_content = textwrap.dedent("""
+        name==1.3
+        """)
+        project_data = {
+            'requirements': {'requirements.txt': 'name>1.2'},
+            'lower-constraints.txt': constraints_content,
+        }
+        head_reqs = check.RequirementsList('testproj', project_data)
+        head_reqs.process(False)
+        stdout = self.useFixture(fixtures.MonkeyPatch(
+            'sys.stdout', io.StringIO())).new_value
+        self.assertTrue(
+            check.validate_lower_constraints(
+                req_list=head_reqs,
+                constraints=project_data['lower-constraints.txt'],
+                denylist=requirement.parse(''),
+            )
+        )
+        self.assertIn("'name' has the exclusive minimum version 1.2",
+                      stdout.getvalue())
+
+    def test_arbitrary_equality(self):
+        constraints_content = textwrap.dedent("""
+        name===abc
+        """)
+        project_data = {
+            'requirements': {'requirements.txt': 'name===abc'},
+            'lower-constraints.txt': constraints_content,
+        }
+        head_reqs = check.RequirementsList('testproj', project_data)
+        head_reqs.process(False)
+        self.assertFalse(
+            check.validate_lower_constraints(
+                req_list=head_reqs,
+                constraints=project_data['lower-constraints.txt'],
+                denylist=requirement.parse(''),
+            )
+        )
+
     def test_constrained_version_excluded(self):
         constraints_content = textwrap.dedent("""
         name==1.2
@@ -716,6 +981,32 @@ class TestValidateLowerConstraints(testtools.TestCase):
             )
         )
 
+    def test_constraints_with_compact_markers(self):
+        constraints_content = textwrap.dedent("""
+        name==1.1;python_version<'3.10'
+        name==2.0;python_version in '3.10 3.11'
+        name==3.0;python_version>='3.12'
+        """)
+        project_data = {
+            'requirements': {
+                'requirements.txt': textwrap.dedent("""
+                name>=1.1;python_version=='3.8'
+                name>=2.0;python_version=='3.11'
+                name>=3.0;python_version>='3.12'
+                """),
+            },
+            'lower-constraints.txt': constraints_content,
+        }
+        head_reqs = check.RequirementsList('testproj', project_data)
+        head_reqs.process(False)
+        self.assertFalse(
+            check.validate_lower_constraints(
+                req_list=head_reqs,
+                constraints=project_data['lower-constraints.txt'],
+                denylist=requirement.parse(''),
+            )
+        )
+
     def test_constraints_with_markers_missing_one_req(self):
         constraints_content = textwrap.dedent("""
         name==1.1;python_version=='2.7'
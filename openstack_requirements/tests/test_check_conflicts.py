@@ -0,0 +1,194 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import importlib.metadata
+import io
+import os
+
+import fixtures
+import testtools
+
+from openstack_requirements.cmds import check_conflicts
+from openstack_requirements import requirement
+from openstack_requirements.tests import common
+from openstack_requirements import wheelhouse
+
+
+class TestCheckConflicts(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.root = self.useFixture(fixtures.TempDir()).path
+        self.site = os.path.join(self.root, 'site-packages')
+        os.mkdir(self.site)
+
+    def _install(self, name, version, requires=()):
+        dist_info = os.path.join(
+            self.site, '%s-%s.dist-info' % (name, version))
+        os.mkdir(dist_info)
+        with open(os.path.join(dist_info, 'METADATA'), 'w') as f:
+            f.write('Metadata-Version: 2.1\nName: %s\nVersion: %s\n'
+                    % (name, version))
+            for req in requires:
+                f.write('Requires-Dist: %s\n' % req)
+
+    def _find(self, *roots):
+        return check_conflicts.find_conflicts(
+            roots, importlib.metadata.distributions(path=[self.site]))
+
+    def test_no_conflicts(self):
+        self._install('a', '1.0', ['b>=1.0', 'c<1.0; python_version<"3"'])
+        self._install('b', '1.5')
+        self._install('c', '2.0')
+        self.assertEqual([], self._find('a'))
+
+    def test_all_conflicts_found(self):
+        self._install('a', '1.0', ['b>=2.0', 'c'])
+        self._install('c', '1.0', ['b>=3.0', 'd'])
+        self._install('e', '1.0', ['b>=2.0'])
+        self._install('b', '1.5')
+        self.assertEqual(
+            [check_conflicts.Conflict('b', '1.5', 'b>=2.0', {'a', 'e'}),
+             check_conflicts.Conflict('b', '1.5', 'b>=3.0', {'c'}),
+             check_conflicts.Conflict('d', None, 'd', {'c'})],
+            self._find('a', 'e'))
+
+    def test_extras_followed(self):
+        self._install('a', '1.0', ['b[fast]'])
+        self._install('b', '1.0', ['c>=2.0; extra == "fast"'])
+        self._install('c', '1.0')
+        self.assertEqual(
+            [check_conflicts.Conflict(
+                'c', '1.0', 'c>=2.0; extra == "fast"', {'b'})],
+            self._find('a'))
+        self.assertEqual([], self._find('b'))
+
+    def test_missing_root(self):
+        self.assertEqual(
+            [check_conflicts.Conflict('a', None, 'a', set())],
+            self._find('a'))
+
+    def test_xfail(self):
+        xfails = requirement.parse('pyopenssl==17.5.0;mitmproxy\n')
+        conflict = check_conflicts.Conflict(
+            'pyOpenSSL', '17.5.0', 'pyopenssl>=18', {'mitmproxy'})
+        self.assertTrue(check_conflicts._is_xfail(conflict, xfails))
+        self.assertFalse(check_conflicts._is_xfail(
+            conflict._replace(required_by={'mitmproxy', 'other'}), xfails))
+        self.assertFalse(check_conflicts._is_xfail(
+            conflict._replace(version='17.6.0'), xfails))
+
+    def test_main(self):
+        self._install('a', '1.0', ['pyopenssl>=18', 'b>=2.0'])
+        self._install('mitmproxy', '1.0', ['pyopenssl>=18'])
+        self._install('pyOpenSSL', '17.5.0')
+        self._install('b', '1.0')
+        uc = os.path.join(self.root, 'upper-constraints.txt')
+        with open(uc, 'w') as f:
+            f.write("mitmproxy===1.0\nb===1.0;python_version=='2.7'\n")
+        xfails = os.path.join(self.root, 'upper-constraints-xfails.txt')
+        with open(xfails, 'w') as f:
+            f.write('pyopenssl==17.5.0;mitmproxy\n')
+        distributions = importlib.metadata.distributions
+        self.useFixture(fixtures.MonkeyPatch(
+            'importlib.metadata.distributions',
+            lambda: distributions(path=[self.site])))
+        self.useFixture(common.CacheDir())
+        stdout = self.useFixture(fixtures.MonkeyPatch(
+            'sys.stdout', io.StringIO())).new_value
+        self.assertEqual(0, check_conflicts.main([uc, xfails]))
+        self.assertIn('XFAIL', stdout.getvalue())
+
+        with open(uc, 'a') as f:
+            f.write('a===1.0\n')
+        self.assertEqual(1, check_conflicts.main([uc, xfails]))
+        self.assertIn('b 1.0 is installed but b>=2.0 is required',
+                      stdout.getvalue())
+
+
+class TestStaticCheckConflicts(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.root = self.useFixture(fixtures.TempDir()).path
+        self.wheelhouse = os.path.join(self.root, 'wheelhouse')
+        common.make_wheel(self.wheelhouse, 'a', '1.0', [
+            'b>=2.0; python_version>="3.10"', 'b; python_version<"3.10"'])
+        common.make_wheel(self.wheelhouse, 'b', '1.0')
+        common.make_wheel(self.wheelhouse, 'b', '2.0')
+        self.uc = os.path.join(self.root, 'upper-constraints.txt')
+        with open(self.uc, 'w') as f:
+            f.write("a===1.0\n"
+                    "b===1.0;python_version<'3.10'\n"
+                    "b===2.0;python_version>='3.10'\n"
+                    "c===1.0\n")
+        self.xfails = os.path.join(self.root, 'xfails.txt')
+        open(self.xfails, 'w').close()
+        self.useFixture(common.CacheDir())
+
+    def test_static_environment(self):
+        with open(self.uc) as f:
+            upper_constraints = requirement.parse(f.read())
+        roots, distributions = check_conflicts.static_environment(
+            upper_constraints,
+            wheelhouse.read_wheelhouse(self.wheelhouse), '3.9')
+        self.assertEqual(['a', 'b', 'c'], roots)
+        self.assertEqual(
+            [('a', '1.0'), ('b', '1.0')],
+            [(d.metadata['Name'], d.version) for d in distributions])
+
+    def test_main(self):
+        stdout = self.useFixture(fixtures.MonkeyPatch(
+            'sys.stdout', io.StringIO())).new_value
+        self.assertEqual(1, check_conflicts.main(
+            [self.uc, self.xfails, '--wheelhouse', self.wheelhouse,
+             '-p', '3.9', '-p', '3.11']))
+        # c has no wheel, for both pythons; nothing else is wrong.
+        self.assertEqual(
+            2, stdout.getvalue().count('DistributionNotFound: c '))
+        self.assertNotIn('VersionConflict', stdout.getvalue())
+
+    def test_main_conflict(self):
+        with open(self.uc, 'w') as f:
+            f.write('a===1.0\nb===1.0\n')
+        stdout = self.useFixture(fixtures.MonkeyPatch(
+            'sys.stdout', io.StringIO())).new_value
+        self.assertEqual(0, check_conflicts.main(
+            [self.uc, self.xfails, '--wheelhouse', self.wheelhouse,
+             '-p', '3.9']))
+        self.assertEqual(1, check_conflicts.main(
+            [self.uc, self.xfails, '--wheelhouse', self.wheelhouse,
+             '-p', '3.10']))
+        self.assertIn('b 1.0 is pinned but b>=2.0', stdout.getvalue())
+
+    def test_main_unconstrainable(self):
+        common.make_wheel(self.wheelhouse, 'pecan', '1.5.1',
+                          ['setuptools', 'flake8>=3; python_version>"3"'])
+        with open(self.uc, 'w') as f:
+            f.write('pecan===1.5.1\n')
+        with open(os.path.join(self.root, 'denylist.txt'), 'w') as f:
+            f.write('flake8\n')
+        stdout = self.useFixture(fixtures.MonkeyPatch(
+            'sys.stdout', io.StringIO())).new_value
+        self.assertEqual(0, check_conflicts.main(
+            [self.uc, self.xfails, '--wheelhouse', self.wheelhouse,
+             '-p', '3.10']))
+        self.assertNotIn('DistributionNotFound', stdout.getvalue())
+
+    def test_skip(self):
+        roots, distributions = check_conflicts.static_environment(
+            requirement.parse('a===1.0\n'),
+            wheelhouse.read_wheelhouse(self.wheelhouse), '3.10')
+        self.assertEqual(
+            [], check_conflicts.find_conflicts(
+                roots, distributions, {'python_version': '3.10'},
+                skip={'b'}))
@@ -14,11 +14,16 @@ import io
 import os
 from unittest import mock
 
+import fixtures
+from packaging import specifiers
+from packaging import version
 import testscenarios
 import testtools
 
 from openstack_requirements.cmds import check_exists
+from openstack_requirements import intervals
 from openstack_requirements import project
+from openstack_requirements import requirement
 from openstack_requirements.tests import common
 
 load_tests = testscenarios.load_tests_apply_scenarios
@@ -39,6 +44,7 @@ class CheckExistsTest(testtools.TestCase):
 
     def setUp(self):
         super(CheckExistsTest, self).setUp()
+        self.useFixture(common.CacheDir())
 
     @mock.patch(
         'openstack_requirements.cmds.check_exists.read_requirements_file',
@@ -194,3 +200,102 @@ class CheckExistsTest(testtools.TestCase):
             ret = check_exists.main([common.project_fixture.root])
         self.assertEqual(ret, 1)
         self.assertIn(expected_out, mock_stdout.getvalue())
+
+
+class BoundsWithinTest(testtools.TestCase):
+
+    def _within(self, spec, global_specifiers):
+        return check_exists._bounds_within(
+            specifiers.Specifier(spec),
+            intervals.from_specifiers(global_specifiers))
+
+    def test_bounds(self):
+        self.assertTrue(self._within('>=1.0', '>=1.0,<2'))
+        self.assertFalse(self._within('>=0.9', '>=1.0'))
+        self.assertTrue(self._within('<2', '>=1.0,<2'))
+        self.assertFalse(self._within('<=2', '>=1.0,<2'))
+        self.assertTrue(self._within('>=1.0', '<2'))
+
+    def test_excluded_bound(self):
+        self.assertFalse(self._within('>=1.4', '>=1.0,!=1.4'))
+        self.assertFalse(self._within('==1.4', '>=1.0,!=1.4'))
+        self.assertTrue(self._within('>1.4', '>=1.0,!=1.4'))
+        self.assertTrue(self._within('>=1.5', '>=1.0,!=1.4'))
+
+
+class CheckExistsBatchTest(testtools.TestCase):
+
+    def setUp(self):
+        super(CheckExistsBatchTest, self).setUp()
+        self.useFixture(common.CacheDir())
+        self.root = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.MockPatch(
+            'openstack_requirements.cmds.check_exists.read_requirements_file',
+            mock_read_requirements_file))
+        self.stdout = self.useFixture(fixtures.MockPatch(
+            'sys.stdout', io.StringIO())).mock
+        common.make_checkout(self.root, 'good', 'six>=1.9.0\nlxml>=2.3\n')
+        common.make_checkout(
+            self.root, 'bad', 'six>1.10.0\nsomerandommodule\n')
+
+    def test_pins_precomputed(self):
+        state = check_exists.load_shared_state(
+            'upper-constraints.txt', 'global-requirements.txt',
+            'denylist.txt')
+        self.assertEqual([('1.10.0', version.Version('1.10.0'))],
+                         state['pins']['six'])
+        self.assertEqual({}, state['gr_ranges'])
+
+    def test_invalid_pin(self):
+        def read_requirements_file(filename):
+            parsed = mock_read_requirements_file(filename)
+            if filename == 'upper-constraints.txt':
+                parsed = dict(parsed)
+                parsed['lxml'] = requirement.parse(
+                    'lxml===3.7.3.weird\n')['lxml']
+            return parsed
+        self.useFixture(fixtures.MockPatch(
+            'openstack_requirements.cmds.check_exists.read_requirements_file',
+            read_requirements_file))
+        good = os.path.join(self.root, 'good')
+        bad = os.path.join(self.root, 'bad')
+        self.assertEqual(1, check_exists.main([good, bad, '-j', '1']))
+        output = self.stdout.getvalue()
+        self.assertIn('lxml has an invalid version in upper-constraints',
+                      output)
+        # Only the project using lxml is affected.
+        self.assertIn('  %s: 1 errors\n' % good, output)
+        self.assertIn('  %s: 2 errors\n' % bad, output)
+
+    def test_gr_check_arbitrary_equality(self):
+        pinned = common.make_checkout(
+            self.root, 'pinned', 'six===1.10.0\nlxml===3.7.3\n')
+        self.assertEqual(0, check_exists.main([pinned, '-G', '-j', '1']))
+        outside = common.make_checkout(self.root, 'outside', 'lxml===2.0\n')
+        self.assertEqual(1, check_exists.main([outside, '-G', '-j', '1']))
+        self.assertIn('Specifier 2.0 from lxml is failing check',
+                      self.stdout.getvalue())
+
+    def test_many_projects(self):
+        good = os.path.join(self.root, 'good')
+        bad = os.path.join(self.root, 'bad')
+        ret = check_exists.main([good, bad, '-j', '2'])
+        self.assertEqual(1, ret)
+        output = self.stdout.getvalue()
+        self.assertIn('  %s: OK\n' % good, output)
+        self.assertIn('  %s: 2 errors\n' % bad, output)
+        # Each project's output is kept together, under its name.
+        self.assertGreater(
+            output.index('somerandommodule from requirements.txt'),
+            output.index('Checking %s' % bad))
+
+    def test_projects_list(self):
+        projects_list = os.path.join(self.root, 'projects.txt')
+        with open(projects_list, 'w') as f:
+            f.write('# comment\ngood\nmissing\n')
+        ret = check_exists.main(
+            ['-p', projects_list, '--root', self.root, '-j', '1'])
+        self.assertEqual(1, ret)
+        self.assertIn('  good: OK\n', self.stdout.getvalue())
+        self.assertIn('  missing: not found under %s\n' % self.root,
+                      self.stdout.getvalue())
@@ -0,0 +1,75 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+
+import fixtures
+import testtools
+
+from openstack_requirements.cmds import check_fleet
+from openstack_requirements.tests import common
+
+
+class TestCheckFleet(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.global_env = self.useFixture(common.GlobalRequirements())
+        self.useFixture(common.CacheDir())
+        self.root = self.useFixture(fixtures.TempDir()).path
+        common.make_checkout(
+            self.root, 'good', 'oslo.config>=1.1.0\nfixtures>=0.3.12\n')
+        common.make_checkout(
+            self.root, 'bad', 'oslo.config\nnot-in-global>=1.0\n')
+
+    def test_check_project(self):
+        state = check_fleet.load_global_state(self.global_env.root)
+        good = check_fleet.check_project(
+            'good', os.path.join(self.root, 'good'), state)
+        self.assertFalse(good['failed'])
+        self.assertIsNone(good['error'])
+        bad = check_fleet.check_project(
+            'bad', os.path.join(self.root, 'bad'), state)
+        self.assertTrue(bad['failed'])
+        self.assertIn('not-in-global', bad['output'])
+
+    def _run_main(self, *extra):
+        output = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                              'report.json')
+        ret = check_fleet.main(
+            [self.root, '--reqs', self.global_env.root, '-o', output]
+            + list(extra))
+        with open(output) as f:
+            return ret, json.load(f)
+
+    def test_main_serial(self):
+        ret, report = self._run_main('--jobs', '1')
+        self.assertEqual(1, ret)
+        self.assertEqual(2, report['checked'])
+        self.assertEqual(['bad'], report['failed'])
+
+    def test_main_pool(self):
+        ret, report = self._run_main('--jobs', '2')
+        self.assertEqual(1, ret)
+        self.assertEqual(['bad', 'good'],
+                         [p['name'] for p in report['projects']])
+        self.assertEqual(['bad'], report['failed'])
+
+    def test_main_missing_project(self):
+        projects_list = os.path.join(self.root, 'projects.txt')
+        with open(projects_list, 'w') as f:
+            f.write('good\nabsent\n')
+        ret, report = self._run_main('--jobs', '1', '-p', projects_list)
+        self.assertEqual(1, ret)
+        self.assertEqual([], report['failed'])
+        self.assertEqual(['absent'], report['missing'])
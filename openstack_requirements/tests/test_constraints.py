@@ -46,6 +46,31 @@ class TestCheckCompatible(testtools.TestCase):
         results = constraints.check_compatible(global_reqs, bad_constraints)
         self.assertNotEqual([], results)
 
+    def test_tried_recorded(self):
+        global_reqs = requirement.parse(
+            "foo>=1.2,<2.0;python_version<'3.10'\n"
+            "foo>=1.5,<1.9;python_version>='3.10'\n")
+        bad_constraints = requirement.parse("foo===2.0.1\n")
+        self.assertEqual(
+            ["Constraint 2.0.1 for foo does not match requirement "
+             "['<2.0,>=1.2', '<1.9,>=1.5']"],
+            constraints.check_compatible(global_reqs, bad_constraints))
+
+    def test_package_name_normalized(self):
+        global_reqs = requirement.parse("Foo_Bar>=1.2\n")
+        bad_constraints = requirement.parse("foo_bar===1.0\n")
+        self.assertEqual(
+            1, len(constraints.check_compatible(global_reqs, bad_constraints)))
+
+    def test_index_reused(self):
+        index = constraints.SpecifierIndex(
+            requirement.parse("foo>=1.2\nbar>2.0\n"))
+        for constraint in ("foo===1.2.5\n", "foo===1.1\n", "bar===1.0\n"):
+            constraints.check_compatible(
+                index, requirement.parse(constraint))
+        self.assertIsNone(index.check('foo', '1.3'))
+        self.assertEqual(['>2.0'], index.check('bar', '2.0'))
+
 
 class TestCheckFormat(testtools.TestCase):
 
@@ -56,6 +81,35 @@ class TestCheckFormat(testtools.TestCase):
             list(constraints.check_format(good_constraints))
         )
 
+    def test_compact_markers(self):
+        good_constraints = requirement.parse(
+            "foo===1.2.5;python_version<'3.10'\n"
+            "foo===1.3;python_version in '3.10 3.11'\n"
+            "foo===1.4;python_version>='3.12'\n")
+        self.assertEqual(
+            [],
+            list(constraints.check_format(good_constraints))
+        )
+
+    def test_overlapping_markers(self):
+        bad_constraints = requirement.parse(
+            "foo===1.2.5;python_version=='3.10'\n"
+            "foo===1.3;python_version>='3.10'\n")
+        self.assertEqual(
+            ['Constraints for foo overlap for python 3.10: '
+             "foo===1.3;python_version>='3.10'\n"],
+            list(constraints.check_format(bad_constraints))
+        )
+
+    def test_invalid_marker(self):
+        bad_constraints = requirement.parse(
+            "foo===1.2.5;python_version=='3.10'\n"
+            "foo===1.3;python_version>>'3.10'\n")
+        self.assertEqual(
+            1,
+            len(list(constraints.check_format(bad_constraints)))
+        )
+
     def test_two_equals(self):
         bad_constraints = requirement.parse("foo==1.2.5\n")
         self.assertEqual(
@@ -103,3 +157,45 @@ class TestDenylistCoverage(testtools.TestCase):
             global_reqs, good_constraints, denylist, 'test'))
         self.assertEqual(1, len(results))
         self.assertIn("'bar' appears in global-requirements.txt", results[0])
+
+
+class TestValidate(testtools.TestCase):
+
+    def test_clean(self):
+        global_reqs = requirement.parse("foo!=1.3\nbar>2.0  # comment\n\n")
+        good_constraints = requirement.parse("foo===1.2.5\nbar===2.1\n")
+        denylist = requirement.parse('flake8\n')
+        self.assertEqual(
+            [],
+            list(constraints.validate(
+                global_reqs, good_constraints, denylist)))
+
+    def test_every_check(self):
+        global_reqs = requirement.parse(
+            "foo>=1.2\nbar<3,>2.0\nbaz #comment\nqux\n")
+        bad_constraints = requirement.parse(
+            "foo===1.0\nbar==2.1\nflake8===1.0\n")
+        denylist = requirement.parse('flake8\nbaz\n')
+        self.assertEqual(
+            [('compatible', 'foo'),
+             ('format', 'bar'), ('compatible', 'bar'), ('denylist', 'flake8'),
+             ('bounds', 'foo'), ('uniform', 'bar'), ('uniform', 'baz'),
+             ('denylist', 'qux')],
+            [(d.check, d.name) for d in constraints.validate(
+                global_reqs, bad_constraints, denylist)])
+        self.assertEqual(
+            [('denylist', 'flake8'), ('denylist', 'qux')],
+            [(d.check, d.name) for d in constraints.validate(
+                global_reqs, bad_constraints, denylist,
+                checks=('denylist',))])
+
+    def test_streams(self):
+        global_reqs = requirement.parse("foo>=1.2\n")
+        diagnostics = constraints.validate(
+            global_reqs, requirement.parse("foo==1.2\n"),
+            requirement.parse(''), 'test')
+        self.assertEqual(
+            constraints.Diagnostic(
+                'format', 'foo',
+                'Invalid constraint for foo does not have 3 "=": foo==1.2\n'),
+            next(diagnostics))
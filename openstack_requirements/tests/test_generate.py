@@ -10,14 +10,25 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import concurrent.futures
+import io
+import json
 import os.path
+import shutil
+import signal
 import subprocess
+import sys
+import time
 
 import fixtures
 import testtools
 from testtools import matchers
 
 from openstack_requirements.cmds import generate
+from openstack_requirements import constraints
+from openstack_requirements import requirement
+from openstack_requirements.tests import common
+from openstack_requirements import wheelhouse
 
 
 class TestFreeze(testtools.TestCase):
@@ -54,18 +65,516 @@ class TestFreeze(testtools.TestCase):
         # Since this is a smoke test, just ensure fixtures is there.
         self.expectThat(frozen[1], matchers.Contains(('fixtures', '2.0.0')))
 
+    def test_freeze_failure_logged(self):
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.MonkeyPatch('tempfile.tempdir', tmpdir))
+        python = os.path.join(tmpdir, 'broken-python')
+        with open(python, 'w') as f:
+            f.write('#!/bin/sh\necho "no python here"\nexit 1\n')
+        os.chmod(python, 0o755)
+        error = self.assertRaises(
+            Exception, generate._freeze, 'requirements.txt', python)
+        self.assertIn('no python here', str(error))
+        logs = [name for name in os.listdir(tmpdir)
+                if name.startswith('generate-constraints-')]
+        self.assertThat(logs, matchers.HasLength(1))
+        self.assertIn('broken-python', logs[0])
+        self.assertIn(logs[0], str(error))
+
+
+class TestVenvTemplates(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.root = self.useFixture(fixtures.TempDir()).path
+        self.templates = os.path.join(self.root, 'templates')
+        self.created = []
+        self.useFixture(fixtures.MonkeyPatch(
+            'openstack_requirements.cmds.generate._create_venv',
+            self._fake_create_venv))
+
+    def _fake_create_venv(self, python, path, run, bootstrap=None,
+                          wheelhouse=None):
+        self.created.append(path)
+        os.makedirs(os.path.join(path, 'bin'))
+        with open(os.path.join(path, 'pyvenv.cfg'), 'w') as f:
+            f.write('home = /usr/bin\n')
+        os.symlink(sys.executable, os.path.join(path, 'bin', 'python'))
+
+    def _clone(self, name):
+        dst = os.path.join(self.root, name)
+        generate._venv_from_template(
+            sys.executable, '3.11.7', dst, None, self.templates)
+        return dst
+
+    def _templates(self):
+        # Leaving out the lock files.
+        return [name for name in os.listdir(self.templates)
+                if not name.startswith('.')]
+
+    def test_template_reused(self):
+        first = self._clone('one')
+        second = self._clone('two')
+        self.assertThat(self.created, matchers.HasLength(1))
+        for venv in (first, second):
+            self.assertTrue(os.path.islink(os.path.join(venv, 'bin/python')))
+        self.assertEqual(
+            os.stat(os.path.join(first, 'pyvenv.cfg')).st_ino,
+            os.stat(os.path.join(second, 'pyvenv.cfg')).st_ino)
+        # Only the template itself is left in the template directory.
+        self.assertThat(self._templates(), matchers.HasLength(1))
+
+    def test_stale_template_rebuilt(self):
+        self._clone('one')
+        template = os.path.join(self.templates, self._templates()[0])
+        old = time.time() - generate.TEMPLATE_MAX_AGE - 1
+        os.utime(template, (old, old))
+        self._clone('two')
+        self.assertThat(self.created, matchers.HasLength(2))
+        self.assertEqual([os.path.basename(template)], self._templates())
+
+    def test_concurrent_rebuild(self):
+        self._clone('one')
+        template = os.path.join(self.templates, self._templates()[0])
+        old = time.time() - generate.TEMPLATE_MAX_AGE - 1
+        os.utime(template, (old, old))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            venvs = list(executor.map(
+                self._clone, ['clone-%d' % i for i in range(16)]))
+        # The stale template is rebuilt once, and never removed while
+        # another job is cloning it.
+        self.assertThat(self.created, matchers.HasLength(2))
+        for venv in venvs:
+            self.assertTrue(os.path.exists(os.path.join(venv, 'pyvenv.cfg')))
+
+    def test_template_name(self):
+        name = generate._template_name(sys.executable, '3.11.7', ['pip'])
+        self.assertTrue(name.startswith('3.11.7-'))
+        self.assertEqual(
+            name, generate._template_name(sys.executable, '3.11.7', ['pip']))
+        self.assertNotEqual(
+            name,
+            generate._template_name(sys.executable, '3.11.7', ['pip==24.0']))
+        self.assertNotEqual(
+            name, generate._template_name(sys.executable, '3.11.8', ['pip']))
+
+
+class TestLocalIndex(testtools.TestCase):
+    """Run pip for real against a local index with a single package."""
+
+    def setUp(self):
+        super().setUp()
+        self.root = self.useFixture(fixtures.TempDir()).path
+        self.wheelhouse = os.path.join(self.root, 'wheelhouse')
+        self.commands = []
+
+    def _run(self, cmd):
+        self.commands.append(cmd)
+        subprocess.check_call(
+            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def test_missing_wheels(self):
+        common.make_wheel(self.wheelhouse, 'oslo_config', '1.0')
+        self.assertEqual(
+            ['pip'],
+            generate._missing_wheels(self.wheelhouse, ['oslo.config', 'pip']))
+        self.assertEqual(
+            ['pip'], generate._missing_wheels(
+                os.path.join(self.root, 'missing'), ['pip']))
+
+    def _setup_index(self):
+        # A local directory laid out as a simple index stands in for PyPI.
+        self.index = os.path.join(self.root, 'index')
+        wheel = common.make_wheel(
+            os.path.join(self.index, 'fakepkg'), 'fakepkg', '1.0')
+        with open(os.path.join(self.index, 'fakepkg', 'index.html'),
+                  'w') as f:
+            f.write('<a href="%s">fakepkg</a>\n' % os.path.basename(wheel))
+        self.useFixture(fixtures.EnvironmentVariable(
+            'PIP_INDEX_URL', 'file://' + self.index))
+        self.useFixture(fixtures.EnvironmentVariable(
+            'PIP_EXTRA_INDEX_URL', ''))
+        self.useFixture(fixtures.EnvironmentVariable(
+            'PIP_DISABLE_PIP_VERSION_CHECK', '1'))
+        venv = os.path.join(self.root, 'venv')
+        try:
+            subprocess.check_call(
+                [sys.executable, '-m', 'venv', venv],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except subprocess.CalledProcessError:
+            self.skipTest('Unable to create a venv with pip')
+        self.venv_python = os.path.join(venv, 'bin', 'python')
+        self.req = os.path.join(self.root, 'requirements.txt')
+        with open(self.req, 'w') as f:
+            f.write('fakepkg==1.0\n')
+
+    def test_install_offline(self):
+        self._setup_index()
+        venv_python, req = self.venv_python, self.req
+
+        # The first install has to build the wheel into the wheelhouse.
+        generate._pip_install(
+            self._run, venv_python, ['-r', req], self.wheelhouse)
+        self.assertEqual(['fakepkg-1.0-py3-none-any.whl'],
+                         os.listdir(self.wheelhouse))
+        self.assertIn('wheel', [cmd[3] for cmd in self.commands])
+
+        # After that the index is not needed at all.
+        shutil.rmtree(self.index)
+        self.commands = []
+        generate._pip_install(
+            self._run, venv_python, ['--force-reinstall', '-r', req],
+            self.wheelhouse)
+        self.assertEqual(['install'], [cmd[3] for cmd in self.commands])
+        self.assertIn('--no-index', self.commands[0])
+
+    def test_resolve_only(self):
+        self._setup_index()
+        report = os.path.join(self.root, 'report.json')
+        generate._pip_install(
+            self._run, self.venv_python, ['-r', self.req], report=report)
+        with open(report) as f:
+            self.assertEqual(
+                [('fakepkg', '1.0')],
+                generate._parse_report(f.read(), '3.11'))
+        # Nothing was installed.
+        self.assertNotEqual(0, subprocess.call(
+            [self.venv_python, '-c', 'import fakepkg'],
+            stderr=subprocess.DEVNULL))
+
+
+class TestFreezeAll(testtools.TestCase):
+
+    def _fake_freeze(self, requirements, python):
+        # Finish the jobs in the reverse order to which they were started.
+        time.sleep(0.05 * (3 - int(python[-1])))
+        return (python[-3:], [('fixtures', '1.%s' % python[-1])])
+
+    def test_serial(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'openstack_requirements.cmds.generate._freeze',
+            self._fake_freeze))
+        self.assertEqual(
+            [('3.1', [('fixtures', '1.1')]), ('3.2', [('fixtures', '1.2')])],
+            generate._freeze_all('r.txt', ['python3.1', 'python3.2']))
+
+    def test_parallel_keeps_order(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'openstack_requirements.cmds.generate._freeze',
+            self._fake_freeze))
+        pythons = ['python3.0', 'python3.1', 'python3.2']
+        self.assertEqual(
+            [generate._freeze('r.txt', python) for python in pythons],
+            generate._freeze_all('r.txt', pythons, jobs=3))
+
+
+class TestFreezeStats(testtools.TestCase):
+
+    def test_nested_phases(self):
+        record = {}
+        stats = generate._FreezeStats(record)
+        with stats.phase('clone'):
+            with stats.phase('venv'):
+                time.sleep(0.05)
+        self.assertGreaterEqual(record['phases']['venv'], 0.05)
+        self.assertLess(record['phases']['clone'], 0.05)
+
+    def test_run(self):
+        record = {}
+        stats = generate._FreezeStats(record)
+        with open(os.devnull, 'wb') as log:
+            stats.run([sys.executable, '-m', 'venv', '--help'], log)
+            self.assertRaises(
+                subprocess.CalledProcessError, stats.run,
+                [sys.executable, '-m', 'pip', 'wheel', '--no-such-option'],
+                log)
+        self.assertEqual(['build', 'venv'], sorted(record['phases']))
+        self.assertGreater(record['peak_rss_kb'], 0)
+
+    def test_run_exit_codes(self):
+        stats = generate._FreezeStats({})
+        with open(os.devnull, 'wb') as log:
+            error = self.assertRaises(
+                subprocess.CalledProcessError, stats.run,
+                [sys.executable, '-c', 'raise SystemExit(3)'], log)
+            self.assertEqual(3, error.returncode)
+            error = self.assertRaises(
+                subprocess.CalledProcessError, stats.run,
+                [sys.executable, '-c',
+                 'import os, signal; os.kill(os.getpid(), signal.SIGTERM)'],
+                log)
+            self.assertEqual(-signal.SIGTERM, error.returncode)
+
+    def test_freeze_all_records(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'openstack_requirements.cmds.generate._freeze',
+            lambda requirements, python, stats: (python[-3:], [])))
+        stats = []
+        generate._freeze_all(
+            'r.txt', ['python3.1', 'python3.2'], jobs=2, stats=stats)
+        self.assertEqual(['python3.1', 'python3.2'],
+                         [record['python'] for record in stats])
+
+
+class TestShards(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        root = self.useFixture(fixtures.TempDir()).path
+        self.wheelhouse = os.path.join(root, 'wheelhouse')
+        # Two independent trees: a -> c and b -> c, and d -> e.
+        common.make_wheel(self.wheelhouse, 'a', '1.0', ['c>=1.0'])
+        common.make_wheel(self.wheelhouse, 'b', '1.0', ['c'])
+        common.make_wheel(self.wheelhouse, 'c', '1.0')
+        common.make_wheel(
+            self.wheelhouse, 'd', '1.0', ['e; python_version>="3.0"'])
+        common.make_wheel(self.wheelhouse, 'e', '1.0')
+        self.wheels = wheelhouse.read_wheelhouse(self.wheelhouse)
+        self.requirements = os.path.join(root, 'requirements.txt')
+        self.frozen = {}
+
+    def _write_requirements(self, text):
+        with open(self.requirements, 'w') as f:
+            f.write(text)
+
+    def _fake_freeze(self, requirements, python, **kwargs):
+        with open(requirements) as f:
+            names = [line.split('>')[0].strip() for line in f
+                     if line.strip() and not line.startswith('-')]
+        frozen = []
+        for name in names:
+            frozen.extend(self.frozen[name])
+        return ('3.11', frozen)
+
+    def test_components(self):
+        self.assertEqual(
+            [['a\n', 'b\n'], ['d\n'], ['x\n', 'y\n']],
+            sorted(generate._requirement_components(
+                [(n, n + '\n') for n in 'abdxy'], self.wheels)))
+
+    def test_plan_shards(self):
+        self._write_requirements('-f somewhere\na\nb>1\n# comment\nd')
+        self.assertEqual(
+            ['-f somewhere\na\nb>1\n', '-f somewhere\nd\n'],
+            generate._plan_shards(self.requirements, self.wheels, 4))
+
+    def test_plan_shards_dominant_component(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'openstack_requirements.cmds.generate.MAX_SHARD_FRACTION', 0.5))
+        self._write_requirements('a\nb\nd\n')
+        self.assertIsNone(
+            generate._plan_shards(self.requirements, self.wheels, 4))
+        self._write_requirements('a\nb\n')
+        self.assertIsNone(
+            generate._plan_shards(self.requirements, self.wheels, 4))
+
+    def test_merge_shards(self):
+        merged, problems = generate._merge_shards(
+            '3.11', [[('a', '1.0'), ('c', '1.0')], [('d', '1.0'),
+                                                    ('e', '1.0')]],
+            self.wheels)
+        self.assertEqual([], problems)
+        self.assertEqual(
+            [('a', '1.0'), ('c', '1.0'), ('d', '1.0'), ('e', '1.0')],
+            merged)
+
+    def test_merge_shards_problems(self):
+        _, problems = generate._merge_shards(
+            '3.11', [[('a', '1.0'), ('c', '0.9')], [('c', '1.0'),
+                                                    ('d', '1.0')]],
+            self.wheels)
+        self.assertEqual(
+            ['c is frozen at both 0.9 and 1.0',
+             'a 1.0 needs c>=1.0, frozen at 0.9',
+             'd 1.0 needs e; python_version >= "3.0", frozen at nothing'],
+            problems)
+
+    def _freeze_all(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'openstack_requirements.cmds.generate._freeze',
+            self._fake_freeze))
+        self.useFixture(fixtures.MonkeyPatch('sys.stderr', io.StringIO()))
+        stats = []
+        freezes = generate._freeze_all(
+            self.requirements, ['python3.11'], jobs=2, stats=stats,
+            shard=True, wheelhouse=self.wheelhouse)
+        return freezes, [record.get('shard') for record in stats]
+
+    def test_freeze_all_sharded(self):
+        self._write_requirements('a\nd\n')
+        self.frozen = {'a': [('a', '1.0'), ('c', '1.0')],
+                       'd': [('d', '1.0'), ('e', '1.0')]}
+        freezes, shards = self._freeze_all()
+        self.assertEqual([0, 1], shards)
+        self.assertEqual(
+            [('3.11', [('a', '1.0'), ('c', '1.0'), ('d', '1.0'),
+                       ('e', '1.0')])],
+            freezes)
+
+    def test_freeze_all_falls_back(self):
+        self._write_requirements('a\nd\n')
+        # The shard for d is missing its dependency e.
+        self.frozen = {'a': [('a', '1.0'), ('c', '1.0')],
+                       'd': [('d', '1.0')]}
+        freezes, shards = self._freeze_all()
+        self.assertEqual([0, 1, None], shards)
+        self.assertIn('freezing in one piece', sys.stderr.getvalue())
+        self.assertEqual(
+            [('3.11', [('a', '1.0'), ('c', '1.0'), ('d', '1.0')])],
+            freezes)
+
+
+class TestFreezeCache(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        root = self.useFixture(fixtures.TempDir()).path
+        self.cache_dir = os.path.join(root, 'cache')
+        self.wheelhouse = os.path.join(root, 'wheelhouse')
+        common.make_wheel(self.wheelhouse, 'fakepkg', '1.0')
+        self.requirements = os.path.join(root, 'requirements.txt')
+        self._write_requirements('fakepkg\n')
+        self.calls = []
+        self.useFixture(fixtures.MonkeyPatch(
+            'openstack_requirements.cmds.generate._freeze',
+            self._fake_freeze))
+
+    def _write_requirements(self, text):
+        with open(self.requirements, 'w') as f:
+            f.write(text)
+
+    def _fake_freeze(self, requirements, python, **kwargs):
+        self.calls.append(python)
+        return ('3.11', [('fakepkg', '1.0')])
+
+    def _freeze_all(self, **kwargs):
+        kwargs.setdefault('wheelhouse', self.wheelhouse)
+        return generate._freeze_all(
+            self.requirements, [sys.executable], cache_dir=self.cache_dir,
+            **kwargs)
+
+    def test_cache_hit(self):
+        first = self._freeze_all()
+        self.assertEqual(first, self._freeze_all())
+        self.assertEqual(1, len(self.calls))
+
+    def test_cache_hit_stats(self):
+        self._freeze_all()
+        stats = []
+        self._freeze_all(stats=stats)
+        self.assertEqual(1, len(self.calls))
+        self.assertTrue(stats[0]['cached'])
+        self.assertEqual('3.11', stats[0]['version'])
+
+    def test_force(self):
+        self._freeze_all()
+        self._freeze_all(force=True)
+        self.assertEqual(2, len(self.calls))
+        self._freeze_all()
+        self.assertEqual(2, len(self.calls))
+
+    def test_inputs_changed(self):
+        self._freeze_all()
+        self._write_requirements('fakepkg>=1.0\n')
+        self._freeze_all()
+        common.make_wheel(self.wheelhouse, 'fakepkg', '2.0')
+        self._freeze_all()
+        self._freeze_all(resolve_only=True)
+        self.assertEqual(4, len(self.calls))
+
+    def test_unrelated_wheels(self):
+        self._freeze_all()
+        # Neither frozen nor a bootstrap package.
+        common.make_wheel(self.wheelhouse, 'otherpkg', '2.0')
+        self._freeze_all()
+        self.assertEqual(1, len(self.calls))
+        common.make_wheel(self.wheelhouse, 'setuptools', '70.0')
+        self._freeze_all()
+        self.assertEqual(2, len(self.calls))
+
+    def test_no_wheelhouse_not_cached(self):
+        self._freeze_all(wheelhouse=None)
+        self._freeze_all(wheelhouse=None)
+        self.assertEqual(2, len(self.calls))
+        self.assertFalse(os.path.exists(self.cache_dir))
+
 
 class TestParse(testtools.TestCase):
 
-    def test_parse(self):
-        text = "linecache2==1.0.0\nargparse==1.2\n\n# fred\n"
-        parsed = generate._parse_freeze(text)
+    def setUp(self):
+        super().setUp()
+        self.venv = self.useFixture(fixtures.TempDir()).path
+        self.site_packages = os.path.join(
+            self.venv, 'lib', 'python3.11', 'site-packages')
+        os.makedirs(self.site_packages)
+
+    def _install(self, name, version, direct_url=None):
+        dist_info = os.path.join(
+            self.site_packages, '%s-%s.dist-info' % (name, version))
+        os.mkdir(dist_info)
+        with open(os.path.join(dist_info, 'METADATA'), 'w') as f:
+            f.write('Metadata-Version: 2.1\nName: %s\nVersion: %s\n'
+                    % (name, version))
+        if direct_url is not None:
+            with open(os.path.join(dist_info, 'direct_url.json'), 'w') as f:
+                json.dump(direct_url, f)
+
+    def test_read_installed(self):
+        self._install('linecache2', '1.0.0')
+        self._install('Babel', '2.3')
+        self._install('pip', '24.0')
+        self._install('setuptools', '69.0')
         self.assertEqual(
-            [('linecache2', '1.0.0'), ('argparse', '1.2')], parsed)
+            [('Babel', '2.3'), ('linecache2', '1.0.0')],
+            generate._read_installed(self.venv, '3.11'))
+        self.assertEqual(
+            [('Babel', '2.3'), ('linecache2', '1.0.0'),
+             ('setuptools', '69.0')],
+            generate._read_installed(self.venv, '3.12'))
 
     def test_editable_banned(self):
-        text = "-e git:..."
-        self.assertRaises(Exception, generate._parse_freeze, text)  # noqa
+        self._install('fred', '1.0', {
+            'url': 'file:///src/fred', 'dir_info': {'editable': True}})
+        self.assertRaises(
+            Exception, generate._read_installed, self.venv, '3.11')  # noqa
+
+    def test_vcs_banned(self):
+        self._install('fred', '1.0', {
+            'url': 'https://example.com/fred.git',
+            'vcs_info': {'vcs': 'git', 'commit_id': 'abc'}})
+        self.assertRaises(
+            Exception, generate._read_installed, self.venv, '3.11')  # noqa
+
+    def test_egg_link_banned(self):
+        open(os.path.join(self.site_packages, 'fred.egg-link'), 'w').close()
+        self.assertRaises(
+            Exception, generate._read_installed, self.venv, '3.11')  # noqa
+
+    def test_parse_report(self):
+        def item(name, version):
+            return {'metadata': {'name': name, 'version': version}}
+        text = json.dumps({'version': '1', 'install': [
+            item('linecache2', '1.0.0'), item('Babel', '2.3'),
+            item('setuptools', '69.0'), item('pip', '24.0')]})
+        self.assertEqual(
+            [('Babel', '2.3'), ('linecache2', '1.0.0')],
+            generate._parse_report(text, '3.11'))
+
+    def test_parse_report_keeps_bootstrap(self):
+        # From 3.12 on a freeze lists the bootstrap setuptools and wheel of
+        # the venv, so the report has to as well.
+        def item(name, version):
+            return {'metadata': {'name': name, 'version': version}}
+        text = json.dumps({'version': '1', 'install': [
+            item('Babel', '2.3'), item('setuptools', '70.0')]})
+        installed = [('pip', '24.0'), ('setuptools', '69.0'),
+                     ('wheel', '0.43.0')]
+        self.assertEqual(
+            [('Babel', '2.3'), ('setuptools', '70.0'), ('wheel', '0.43.0')],
+            generate._parse_report(text, '3.12', installed))
+        self.assertEqual(
+            [('Babel', '2.3')],
+            generate._parse_report(text, '3.11', installed))
 
 
 class TestCombine(testtools.TestCase):
@@ -115,6 +624,35 @@ class TestCombine(testtools.TestCase):
             list(generate._combine_freezes(
                 [freeze_27], denylist=denylist)))
 
+    def _compact_freezes(self):
+        def freeze(version, a, b):
+            return (version, [('a', a), ('b', b)])
+        return [freeze('3.8', '1.0', '1.0'), freeze('3.9', '1.0', '2.0'),
+                freeze('3.10', '2.0', '1.0'), freeze('3.11', '2.0', '3.0')]
+
+    def test_compact_markers(self):
+        self.assertEqual(
+            ["a===1.0;python_version<'3.10'\n",
+             "a===2.0;python_version>='3.10'\n",
+             "b===1.0;python_version in '3.8 3.10'\n",
+             "b===2.0;python_version=='3.9'\n",
+             "b===3.0;python_version=='3.11'\n"],
+            list(generate._combine_freezes(
+                self._compact_freezes(), compact=True)))
+
+    def test_compact_markers_round_trip(self):
+        freezes = self._compact_freezes()
+        parsed = requirement.parse(''.join(
+            generate._combine_freezes(freezes, compact=True)))
+        self.assertEqual([], list(constraints.check_format(parsed)))
+        for py_version, freeze in freezes:
+            for package, version in freeze:
+                self.assertEqual(
+                    ['===' + version],
+                    [req.specifiers for req, _ in parsed[package]
+                     if py_version in requirement.marker_python_versions(
+                         req.markers)])
+
 
 class Namespace(object):
     def __init__(self, **kwargs):
@@ -0,0 +1,80 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import configparser
+import os.path
+import subprocess
+import sys
+
+import testscenarios
+import testtools
+
+
+load_tests = testscenarios.load_tests_apply_scenarios
+
+_SETUP_CFG = os.path.join(
+    os.path.dirname(__file__), os.pardir, os.pardir, 'setup.cfg')
+
+# Generous enough to absorb a slow CI node, small enough to catch anything
+# that drags pkg_resources (or similar) back in at import time.
+IMPORT_TIME_BUDGET_US = 1000000
+
+# Modules which scan the whole environment or are deprecated, and must only
+# ever be imported lazily.
+BANNED_MODULES = frozenset(['pkg_resources', 'distutils'])
+
+
+def _entry_point_scenarios():
+    config = configparser.ConfigParser()
+    config.read(_SETUP_CFG)
+    scenarios = []
+    for line in config.get('entry_points', 'console_scripts').splitlines():
+        if not line.strip():
+            continue
+        name, target = [x.strip() for x in line.split('=')]
+        module = target.split(':')[0]
+        scenarios.append((name, dict(module=module)))
+    return scenarios
+
+
+def _parse_importtime(text):
+    """Return a dict of module name to cumulative import time in us."""
+    times = {}
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            cumulative = int(fields[1])
+        except ValueError:
+            # The header line.
+            continue
+        times[fields[2].strip()] = cumulative
+    return times
+
+
+class TestImportTime(testtools.TestCase):
+
+    scenarios = _entry_point_scenarios()
+
+    def test_import_time(self):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c',
+             'import %s' % self.module],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        self.assertEqual(0, proc.returncode, proc.stderr)
+        times = _parse_importtime(proc.stderr)
+        self.assertEqual(set(), BANNED_MODULES.intersection(times))
+        self.assertLess(times[self.module], IMPORT_TIME_BUDGET_US)
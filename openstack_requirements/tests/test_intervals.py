@@ -0,0 +1,123 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import packaging.specifiers
+import packaging.version
+import testscenarios
+import testtools
+
+from openstack_requirements import intervals
+
+
+load_tests = testscenarios.load_tests_apply_scenarios
+
+
+class TestCompile(testtools.TestCase):
+
+    scenarios = [
+        ('everything', dict(
+            specifiers='', expected='(-inf, inf)')),
+        ('range', dict(
+            specifiers='>=1.2,!=1.4,<2', expected='[1.2, 1.4) u (1.4, 2)')),
+        ('unsorted_exclusions', dict(
+            specifiers='!=1.4,>1.0,!=1.3',
+            expected='(1.0, 1.3) u (1.3, 1.4) u (1.4, inf)')),
+        ('exclusion_outside', dict(
+            specifiers='>=1.2,!=1.0,!=3.0,<2', expected='[1.2, 2)')),
+        ('compatible', dict(
+            specifiers='~=1.4.2', expected='[1.4.2, 1.5.dev0)')),
+        ('compatible_suffix', dict(
+            specifiers='~=2.2.post3', expected='[2.2.post3, 3.dev0)')),
+        ('compatible_epoch', dict(
+            specifiers='~=1!2.2', expected='[1!2.2, 1!3.dev0)')),
+        ('prefix', dict(
+            specifiers='==1.4.*', expected='[1.4.dev0, 1.5.dev0)')),
+        ('prefix_exclusion', dict(
+            specifiers='>=1,!=1.4.*',
+            expected='[1, 1.4.dev0) u [1.5.dev0, inf)')),
+        ('pin', dict(
+            specifiers='==1.0', expected='[1.0, 1.0]')),
+        ('excluded_bound', dict(
+            specifiers='>=1.2,!=1.2', expected='(1.2, inf)')),
+        ('contradiction', dict(
+            specifiers='>=2,<1', expected='{}')),
+        ('excluded_pin', dict(
+            specifiers='==1.0,!=1.0', expected='{}')),
+    ]
+
+    def test_compile(self):
+        version_range = intervals.from_specifiers(self.specifiers)
+        self.assertEqual(self.expected, str(version_range))
+
+    def test_agrees_with_packaging(self):
+        version_range = intervals.from_specifiers(self.specifiers)
+        specifier_set = packaging.specifiers.SpecifierSet(self.specifiers)
+        for version in ['0.9', '1.0', '1.2', '1.3', '1.4', '1.4.1', '1.4.2',
+                        '1.4.5', '1.5', '1.9', '2', '2.0.1', '3.0']:
+            self.assertEqual(
+                specifier_set.contains(version), version in version_range,
+                version)
+
+
+class TestArbitraryEquality(testtools.TestCase):
+
+    scenarios = [
+        ('version', dict(specifiers='===1.4')),
+        ('wildcard', dict(specifiers='===1.*')),
+        ('not_a_version', dict(specifiers='===abc')),
+    ]
+
+    def test_rejected(self):
+        # '===1.4' does not admit 1.4.0, which no interval can express.
+        self.assertRaises(
+            ValueError, intervals.compile_specifier_set,
+            packaging.specifiers.SpecifierSet(self.specifiers))
+
+
+class TestQueries(testtools.TestCase):
+
+    def _range(self, specifiers):
+        return intervals.from_specifiers(specifiers)
+
+    def test_issubset(self):
+        self.assertTrue(self._range('>=1.2,!=1.4').issubset(
+            self._range('>=1.0,!=1.4')))
+        self.assertFalse(self._range('>=1.0,!=1.4').issubset(
+            self._range('>=1.2,!=1.4')))
+        self.assertFalse(self._range('>=1.2').issubset(
+            self._range('!=1.4')))
+        self.assertTrue(self._range('<2').issubset(self._range('<=2')))
+        self.assertFalse(self._range('<=2').issubset(self._range('<2')))
+        self.assertTrue(self._range('>=2,<1').issubset(self._range('==5')))
+
+    def test_intersection(self):
+        self.assertEqual(
+            self._range('>=1.2,!=1.4,<1.5'),
+            self._range('>=1.2,!=1.4').intersection(self._range('<1.5')))
+        self.assertTrue(
+            self._range('<1').intersection(self._range('>1')).is_empty())
+
+    def test_lowest(self):
+        self.assertEqual(packaging.version.Version('1.4'),
+                         self._range('>=1.2,>=1.4,<2').lowest())
+        self.assertEqual(packaging.version.Version('1.4'),
+                         self._range('~=1.4').lowest())
+        self.assertIsNone(self._range('>1.4').lowest())
+        self.assertIsNone(self._range('<2').lowest())
+        self.assertIsNone(self._range('>=2,<1').lowest())
+
+    def test_hull(self):
+        self.assertEqual(
+            intervals.Interval(packaging.version.Version('1.2'), True,
+                               packaging.version.Version('2'), False),
+            self._range('>=1.2,!=1.4,<2').hull())
+        self.assertIsNone(self._range('>=2,<1').hull())
@@ -10,10 +10,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import random
+import sys
 import textwrap
 
-import pkg_resources
-import pkg_resources.extern.packaging.requirements as pkg_resources_reqs
+from packaging import markers
+from packaging import requirements
+from packaging import specifiers
+from packaging import version
 import testscenarios
 import testtools
 
@@ -55,7 +59,21 @@ class TestParseRequirement(testtools.TestCase):
         ('markers-with-comment', dict(
          line="Sphinx<=1.2; python_version=='2.7'# Sadface",
          req=requirement.Requirement('Sphinx', '', '<=1.2',
-                                     "python_version=='2.7'", '# Sadface')))]
+                                     "python_version=='2.7'", '# Sadface'))),
+        ('underscores', dict(
+         line='oslo_config>=1.0',
+         req=requirement.Requirement('oslo-config', '', '>=1.0', '', ''))),
+        ('whitespace', dict(
+         line='alembic >= 0.4.1 , != 1.1.8',
+         req=requirement.Requirement('alembic', '', '!=1.1.8,>=0.4.1', '',
+                                     ''))),
+        ('extras', dict(
+         line='oslo.db[Fixtures, mysql_extra]>=1.0',
+         req=requirement.Requirement('oslo.db', '', '>=1.0', '', '',
+                                     ('fixtures', 'mysql_extra')))),
+        ('legacy-version', dict(
+         line='pytz>=2011b',
+         req=requirement.Requirement('pytz', '', '>=2011b', '', '')))]
     url_scenarios = [
         ('url', dict(
          line='file:///path/to/thing#egg=thing',
@@ -98,6 +116,55 @@ class TestParseRequirement(testtools.TestCase):
         self.assertEqual(self.req, parsed)
 
 
+class TestFastParse(testtools.TestCase):
+    """Check the fast path against the full packaging parser."""
+
+    names = ['a', 'pbr', 'oslo.config', 'Oslo_Config', 'python-novaclient',
+             'zope.interface', 'x__y', 'A1', 'foo-', '.foo', 'foo bar']
+    extras = ['', '[fixtures]', '[a,b]', '[ A_b , c.d ]', '[]', '[a,]',
+              '[-a]']
+    ops = ['>=', '<=', '==', '===', '!=', '~=', '<', '>', '=>', '=']
+    versions = ['1', '1.0', '1.0.0', '2.0.0a1', '2.0rc3', '1.0.post1',
+                '1.0.dev2', '1.0.*', '1.2.*', '0', '2011b', '1.0+local',
+                '1.0-rc1', 'abc', '', '01.0']
+    spaces = ['', ' ', '  ']
+
+    def _random_line(self, rng):
+        specs = []
+        for _ in range(rng.randrange(4)):
+            specs.append('%s%s%s%s' % (
+                rng.choice(self.spaces), rng.choice(self.ops),
+                rng.choice(self.spaces), rng.choice(self.versions)))
+        return '%s%s%s%s%s%s' % (
+            rng.choice(self.spaces), rng.choice(self.names),
+            rng.choice(self.spaces), rng.choice(self.extras),
+            ','.join(specs), rng.choice(self.spaces))
+
+    def test_differential(self):
+        rng = random.Random(1234)
+        fast_count = 0
+        for _ in range(5000):
+            line = self._random_line(rng)
+            fast = requirement._parse_requirement_fast(line)
+            if fast is None:
+                continue
+            fast_count += 1
+            slow = requirement._parse_requirement_slow(line)
+            self.assertEqual(
+                (slow[0], frozenset(slow[1]), slow[2]),
+                (fast[0], frozenset(fast[1]), fast[2]),
+                line)
+        # Make sure the generator is actually exercising the fast path.
+        self.assertGreater(fast_count, 500)
+
+    def test_ambiguous_duplicates_fall_back(self):
+        self.assertIsNone(
+            requirement._parse_requirement_fast('foo>=1.0,>=1.0.0'))
+        self.assertEqual(
+            ('foo', (), '>=1.0'),
+            requirement._parse_requirement_fast('foo>=1.0,>=1.0'))
+
+
 class TestParseRequirementFailures(testtools.TestCase):
 
     scenarios = [
@@ -109,13 +176,49 @@ class TestParseRequirementFailures(testtools.TestCase):
     def test_does_not_parse(self):
         try:
             requirement.parse_line(self.line)
-        except (pkg_resources.RequirementParseError,
-                pkg_resources_reqs.InvalidRequirement):
+        except requirements.InvalidRequirement:
             pass
         else:
             self.fail('No exception triggered')
 
 
+class TestParsedAttributes(testtools.TestCase):
+
+    def test_no_instance_dict(self):
+        req = requirement.Requirement('foo', '', '>=1.0', '', '')
+        self.assertFalse(hasattr(req, '__dict__'))
+
+    def test_package_interned(self):
+        name = ''.join(['oslo', '.config'])
+        req = requirement.Requirement(name, '', '', '', '')
+        self.assertIs(req.package, sys.intern('oslo.config'))
+
+    def test_specifier_set(self):
+        req = requirement.parse_line('foo>=1.0,!=1.2')
+        self.assertEqual(
+            specifiers.SpecifierSet('>=1.0,!=1.2'), req.specifier_set)
+        other = requirement.parse_line('bar>=1.0,!=1.2')
+        self.assertIs(req.specifier_set, other.specifier_set)
+
+    def test_pinned_version(self):
+        req = requirement.parse_line('foo===1.2.3')
+        self.assertEqual(version.Version('1.2.3'), req.pinned_version)
+
+    def test_pinned_version_not_pinned(self):
+        self.assertIsNone(requirement.parse_line('foo>=1.0').pinned_version)
+        self.assertIsNone(requirement.parse_line('foo==1.0').pinned_version)
+
+    def test_pinned_version_invalid(self):
+        req = requirement.Requirement('foo', '', '===not-a-version', '', '')
+        self.assertIsNone(req.pinned_version)
+
+    def test_marker(self):
+        req = requirement.parse_line("foo;python_version=='3.8'")
+        self.assertEqual(
+            markers.Marker("python_version=='3.8'"), req.marker)
+        self.assertIsNone(requirement.parse_line('foo').marker)
+
+
 class TestToContent(testtools.TestCase):
 
     def test_smoke(self):
@@ -155,8 +258,7 @@ class TestToReqs(testtools.TestCase):
     def test_not_urls(self):
         try:
             list(requirement.to_reqs('file:///foo#egg=foo'))
-        except (pkg_resources.RequirementParseError,
-                pkg_resources_reqs.InvalidRequirement):
+        except requirements.InvalidRequirement:
             pass
         else:
             self.fail('No exception triggered')
@@ -193,6 +295,56 @@ class TestToReqs(testtools.TestCase):
                               ['oslo.config', 'oslo.concurrency', 'oslo.db'])
 
 
+class TestParseCache(testtools.TestCase):
+
+    def test_hit(self):
+        cache = requirement.ParseCache()
+        first = cache.get('oslo.config>=6.8.0')
+        second = cache.get('oslo.config>=6.8.0')
+        self.assertIs(first, second)
+        self.assertEqual(
+            requirement.Requirement('oslo.config', '', '>=6.8.0', '', ''),
+            first)
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_permit_urls_is_part_of_key(self):
+        cache = requirement.ParseCache()
+        cache.get('foo>=1.0')
+        cache.get('foo>=1.0', permit_urls=True)
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(2, cache.misses)
+
+    def test_eviction(self):
+        cache = requirement.ParseCache(maxsize=2)
+        cache.get('a')
+        cache.get('b')
+        # Touch 'a' so that 'b' is the least recently used entry.
+        cache.get('a')
+        cache.get('c')
+        self.assertEqual(2, len(cache))
+        self.assertEqual(1, cache.evictions)
+        cache.get('a')
+        self.assertEqual(2, cache.hits)
+        cache.get('b')
+        self.assertEqual(4, cache.misses)
+
+    def test_errors_not_cached(self):
+        cache = requirement.ParseCache()
+        for _ in range(2):
+            self.assertRaises(
+                requirements.InvalidRequirement,
+                cache.get, 'file:///foo#egg=foo')
+        self.assertEqual(0, len(cache))
+        self.assertEqual(2, cache.misses)
+
+    def test_parse_uses_cache(self):
+        before = requirement.parse_cache_stats()
+        requirement.parse('cache-test-pkg>=1.0\ncache-test-pkg>=1.0\n')
+        after = requirement.parse_cache_stats()
+        self.assertGreaterEqual(after['hits'] - before['hits'], 1)
+
+
 class TestCanonicalName(testtools.TestCase):
 
     def test_underscores(self):
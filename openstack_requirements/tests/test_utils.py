@@ -0,0 +1,137 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import fixtures
+import testtools
+
+from openstack_requirements import requirement
+from openstack_requirements.tests import common
+from openstack_requirements import utils
+
+
+class TestReadRequirementsFile(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = self.useFixture(common.CacheDir()).path
+        self.req_file = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'requirements.txt')
+        self._write('oslo.config>=1.0  # Apache-2.0\npbr===5.0.0\n')
+
+    def _write(self, content):
+        with open(self.req_file, 'w') as f:
+            f.write(content)
+
+    def _break_parse(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'openstack_requirements.requirement.parse',
+            lambda *a, **kw: self.fail('parsed instead of using the cache')))
+
+    def test_same_result_as_parse(self):
+        with open(self.req_file) as f:
+            expected = requirement.parse(f.read())
+        self.assertEqual(expected, utils.read_requirements_file(self.req_file))
+        # And again, this time from the snapshot.
+        self.assertEqual(expected, utils.read_requirements_file(self.req_file))
+
+    def test_snapshot_reused(self):
+        expected = utils.read_requirements_file(self.req_file)
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+        self._break_parse()
+        self.assertEqual(expected, utils.read_requirements_file(self.req_file))
+
+    def test_content_change_invalidates(self):
+        utils.read_requirements_file(self.req_file)
+        self._write('pbr===6.0.0\n')
+        parsed = utils.read_requirements_file(self.req_file)
+        self.assertEqual('===6.0.0', parsed['pbr'][0][0].specifiers)
+        self.assertEqual(2, len(os.listdir(self.cache_dir)))
+
+    def test_corrupt_snapshot_ignored(self):
+        expected = utils.read_requirements_file(self.req_file)
+        for name in os.listdir(self.cache_dir):
+            with open(os.path.join(self.cache_dir, name), 'wb') as f:
+                f.write(b'garbage')
+        self.assertEqual(expected, utils.read_requirements_file(self.req_file))
+
+    def test_cache_disabled(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'OPENSTACK_REQUIREMENTS_CACHE_DIR', ''))
+        utils.read_requirements_file(self.req_file)
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_cache_false(self):
+        utils.read_requirements_file(self.req_file, cache=False)
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+
+class TestFindProjects(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.root = self.useFixture(fixtures.TempDir()).path
+        os.mkdir(os.path.join(self.root, 'good'))
+        os.mkdir(os.path.join(self.root, 'bad'))
+
+    def test_find_projects(self):
+        self.assertEqual(
+            [('bad', os.path.join(self.root, 'bad')),
+             ('good', os.path.join(self.root, 'good'))],
+            utils.find_projects(self.root))
+
+    def test_find_projects_from_list(self):
+        projects_list = os.path.join(self.root, 'projects.txt')
+        with open(projects_list, 'w') as f:
+            f.write('# comment\nopenstack/good\n\nopenstack/bad\n')
+        self.assertEqual(
+            [('openstack/good', os.path.join(self.root, 'openstack/good')),
+             ('openstack/bad', os.path.join(self.root, 'openstack/bad'))],
+            utils.find_projects(self.root, projects_list))
+
+
+def _scale(state, value):
+    # Pickled into the worker processes, so it has to be at module level.
+    return state * value
+
+
+def _noisy(value):
+    print('value is %s' % value)
+    if value is None:
+        raise ValueError('no value')
+    return value
+
+
+class TestMapWithState(testtools.TestCase):
+
+    def test_serial(self):
+        self.assertEqual(
+            [3, 6], list(utils.map_with_state(_scale, 3, [(1,), (2,)], 1)))
+
+    def test_pool(self):
+        self.assertEqual(
+            [3, 6, 9],
+            list(utils.map_with_state(_scale, 3, [(1,), (2,), (3,)], 2)))
+
+
+class TestCallCaptured(testtools.TestCase):
+
+    def test_result(self):
+        self.assertEqual(
+            (2, 'value is 2\n', None), utils.call_captured(_noisy, 2))
+
+    def test_error(self):
+        result, output, error = utils.call_captured(_noisy, None)
+        self.assertIsNone(result)
+        self.assertEqual('value is None\n', output)
+        self.assertIn('ValueError: no value', error)
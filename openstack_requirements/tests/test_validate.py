@@ -0,0 +1,132 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import io
+import json
+import os
+import subprocess
+
+import fixtures
+import testtools
+
+from openstack_requirements.cmds import validate
+from openstack_requirements.tests import common
+
+
+class TestValidateBranches(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.root = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(common.CacheDir())
+        self.stdout = self.useFixture(fixtures.MonkeyPatch(
+            'sys.stdout', io.StringIO())).new_value
+
+    def _write(self, directory, gr, uc, denylist='flake8\n'):
+        os.makedirs(os.path.join(self.root, directory), exist_ok=True)
+        paths = []
+        for filename, body in zip(validate.FILENAMES, (gr, uc, denylist)):
+            path = os.path.join(self.root, directory, filename)
+            with open(path, 'w') as f:
+                f.write(body)
+            paths.append(path)
+        return paths
+
+    def _git(self, *args):
+        subprocess.run(
+            ['git', '-C', self.root, '-c', 'user.name=test',
+             '-c', 'user.email=test@example.com'] + list(args),
+            check=True, stdout=subprocess.DEVNULL)
+
+    def test_identical_branches_validated_once(self):
+        paths = (self._write('master', 'foo\n', 'foo===1.0\n') +
+                 self._write('stable', 'foo\n', 'foo===1.0\n') +
+                 self._write('old', 'foo!=1.0\n', 'foo===1.0\n'))
+        branches, contents = validate.read_triples(paths)
+        self.assertEqual(4, len(contents))
+        calls = []
+        validate_branch = validate.validate_branch
+        self.useFixture(fixtures.MonkeyPatch(
+            'openstack_requirements.cmds.validate.validate_branch',
+            lambda *args: calls.append(args) or validate_branch(*args)))
+        report = dict(
+            validate.validate_branches(branches, contents, jobs=1))
+        self.assertEqual(2, len(calls))
+        self.assertEqual([], report[paths[1]])
+        self.assertEqual([], report[paths[4]])
+        self.assertEqual(['compatible'], [d.check for d in report[paths[7]]])
+
+    def test_read_refs(self):
+        self._git('init', '-q')
+        self._write('', 'foo\n', 'foo===1.0\n')
+        self._git('add', '.')
+        self._git('commit', '-q', '-m', 'first')
+        self._write('', 'foo\n', 'foo===2.0\n')
+        self._git('commit', '-q', '-a', '-m', 'second')
+        branches, contents = validate.read_refs(self.root, ['HEAD~1', 'HEAD'])
+        self.assertEqual(['HEAD~1', 'HEAD'], [name for name, _ in branches])
+        # Only upper-constraints.txt differs between the two.
+        self.assertEqual(4, len(contents))
+        self.assertEqual('foo===2.0\n', contents[branches[1][1][1]])
+        self.assertRaises(
+            Exception, validate.read_refs, self.root, ['missing'])
+
+    def test_main(self):
+        paths = (self._write('master', 'foo\n', 'foo===1.0\n') +
+                 self._write('stable', 'foo!=1.0\n', 'foo===1.0\n'))
+        output = os.path.join(self.root, 'report.json')
+        self.assertEqual(1, validate.main(paths + ['-o', output, '-j', '2']))
+        self.assertIn('%s: 1 errors' % paths[4], self.stdout.getvalue())
+        with open(output) as f:
+            report = json.load(f)
+        self.assertEqual([paths[4]], report['failed'])
+        self.assertEqual([], report['branches'][paths[1]])
+
+    def test_main_single(self):
+        self.assertEqual(0, validate.main(
+            self._write('master', 'foo\n', 'foo===1.0\n')))
+        self.assertNotIn('Summary', self.stdout.getvalue())
+
+    def test_main_single_streams(self):
+        paths = self._write('master', 'foo>=1.0\n', 'foo==1.0\n')
+        printed = []
+        validate_ = validate.constraints.validate
+
+        def validate_streaming(*args, **kwargs):
+            for diagnostic in validate_(*args, **kwargs):
+                # Everything before this diagnostic is out already.
+                printed.append(self.stdout.getvalue())
+                yield diagnostic
+        self.useFixture(fixtures.MonkeyPatch(
+            'openstack_requirements.constraints.validate',
+            validate_streaming))
+        self.assertEqual(1, validate.main(paths))
+        self.assertEqual(3, len(printed))
+        self.assertNotIn('does not have 3 "="', printed[0])
+        self.assertIn('does not have 3 "="', printed[1])
+        output = self.stdout.getvalue()
+        self.assertIn('\nChecking %s\nInvalid constraint' % paths[1], output)
+        self.assertIn('\nChecking requirements on %s\nRequirement foo'
+                      % paths[0], output)
+
+    def test_main_single_headers(self):
+        paths = self._write('master', 'foo\n', 'foo===1.0\n')
+        self.assertEqual(0, validate.main(paths))
+        # Every check gets its header, in order, even with nothing to say.
+        self.assertEqual(
+            '\nChecking %s\n'
+            '\nChecking %s\n'
+            '\nChecking requirements on %s\n'
+            '\nValidating uniform formatting on %s\n'
+            '\nChecking %s\n'
+            % (paths[1], paths[0], paths[0], paths[0], paths[2]),
+            self.stdout.getvalue())
@@ -0,0 +1,50 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+
+import fixtures
+import testtools
+
+from openstack_requirements.tests import common
+from openstack_requirements import wheelhouse
+
+
+class TestWheelhouse(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.wheelhouse = self.useFixture(fixtures.TempDir()).path
+
+    def test_read_wheel(self):
+        requires = ('six>=1.0', 'pbr; python_version<"3.8"')
+        path = common.make_wheel(
+            self.wheelhouse, 'oslo_config', '1.0', requires)
+        self.assertEqual(
+            wheelhouse.Wheel(
+                'oslo_config', '1.0', requires,
+                'oslo_config-1.0-py3-none-any.whl'),
+            wheelhouse.read_wheel(path))
+
+    def test_read_wheelhouse(self):
+        common.make_wheel(self.wheelhouse, 'oslo_config', '1.0')
+        common.make_wheel(self.wheelhouse, 'oslo_config', '2.0')
+        common.make_wheel(self.wheelhouse, 'six', '1.0')
+        open(os.path.join(self.wheelhouse, 'six-1.0.tar.gz'), 'w').close()
+        wheels = wheelhouse.read_wheelhouse(self.wheelhouse)
+        self.assertEqual(['oslo-config', 'six'], sorted(wheels))
+        self.assertEqual(
+            ['1.0', '2.0'], [w.version for w in wheels['oslo-config']])
+
+    def test_missing_wheelhouse(self):
+        self.assertEqual({}, wheelhouse.read_wheelhouse(
+            os.path.join(self.wheelhouse, 'missing')))
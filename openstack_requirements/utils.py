@@ -1,7 +1,177 @@
+import concurrent.futures
+import contextlib
+import hashlib
+import io
+import os
+import pickle
+import tempfile
+import traceback
+
 from openstack_requirements import requirement
 
 
-def read_requirements_file(filename):
+# Bump this whenever the output of requirement.parse changes, so snapshots
+# written by older code are not picked up.
+_SNAPSHOT_FORMAT = 1
+
+# Set in each worker process of map_with_state to its state, so the state
+# is sent to each worker once rather than with every task.
+_worker_state = None
+
+
+def get_cache_dir():
+    """Return the directory parsed snapshots are kept in, or None.
+
+    OPENSTACK_REQUIREMENTS_CACHE_DIR overrides the location; setting it to
+    an empty string disables the cache.
+    """
+    path = os.environ.get('OPENSTACK_REQUIREMENTS_CACHE_DIR')
+    if path is None:
+        base = (os.environ.get('XDG_CACHE_HOME') or
+                os.path.join(os.path.expanduser('~'), '.cache'))
+        path = os.path.join(base, 'openstack-requirements')
+    return path or None
+
+
+def _snapshot_path(cache_dir, body):
+    digest = hashlib.sha256(body.encode('utf-8')).hexdigest()
+    return os.path.join(
+        cache_dir, 'parsed-%d-%s.pickle' % (_SNAPSHOT_FORMAT, digest))
+
+
+def load_snapshot(path):
+    """Return the object pickled at path, or None if it cannot be read."""
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        # Missing, truncated or otherwise unreadable snapshots are a miss.
+        return None
+
+
+def save_snapshot(path, parsed):
+    """Pickle parsed to path, ignoring any failure to do so."""
+    dirname = os.path.dirname(path)
+    try:
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # Write then rename, so concurrent readers never see a partial
+            # snapshot.
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        # The cache is only an optimisation; never fail because of it.
+        pass
+
+
+def parse_requirements(body, cache=True):
+    """Parse the content of a requirements file.
+
+    The parsed result is kept on disk keyed by a hash of body, so commands
+    run back to back parse each version of a file only once.
+
+    :param cache: If False, always parse and leave the cache alone.
+    """
+    cache_dir = get_cache_dir() if cache else None
+    if cache_dir is None:
+        return requirement.parse(body)
+    path = _snapshot_path(cache_dir, body)
+    parsed = load_snapshot(path)
+    if parsed is None:
+        parsed = requirement.parse(body)
+        save_snapshot(path, parsed)
+    return parsed
+
+
+def read_requirements_file(filename, cache=True):
+    """Read and parse a requirements file.
+
+    See parse_requirements for the caching of the parsed result.
+
+    :param cache: If False, always parse and leave the cache alone.
+    """
     with open(filename, 'rt') as f:
         body = f.read()
-    return requirement.parse(body)
+    return parse_requirements(body, cache=cache)
+
+
+def find_projects(root, projects_list=None):
+    """Return a list of (name, path) tuples for the projects to check.
+
+    :param root: A directory holding the project checkouts.
+    :param projects_list: Optional path to a projects.txt style file. When
+        given, each listed repo is expected at root/<repo>; otherwise every
+        directory directly under root is treated as a project.
+    """
+    if projects_list is None:
+        return [
+            (entry, os.path.join(root, entry))
+            for entry in sorted(os.listdir(root))
+            if os.path.isdir(os.path.join(root, entry))
+        ]
+    projects = []
+    with open(projects_list, 'rt') as f:
+        for repo in f:
+            repo = repo.strip()
+            if not repo or repo.startswith('#'):
+                continue
+            projects.append((repo, os.path.join(root, repo)))
+    return projects
+
+
+def _init_worker(state):
+    global _worker_state
+    _worker_state = state
+
+
+def _call_in_worker(func, args):
+    return func(_worker_state, *args)
+
+
+def map_with_state(func, state, tasks, jobs=None):
+    """Call func(state, *args) for each args in tasks.
+
+    With several tasks and jobs other than 1 the calls run in a process
+    pool, and state is sent to each worker process only once. func has to
+    be a module level function, so that it can be pickled.
+
+    :param tasks: A list of argument tuples.
+    :param jobs: The number of worker processes, by default the number of
+        CPUs.
+    :return: An iterator of the results, in the order of tasks, each
+        yielded as soon as it and those before it are done.
+    """
+    if jobs == 1 or len(tasks) <= 1:
+        for args in tasks:
+            yield func(state, *args)
+        return
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(state,)) as executor:
+        futures = [executor.submit(_call_in_worker, func, args)
+                   for args in tasks]
+        for future in futures:
+            yield future.result()
+
+
+def call_captured(func, *args):
+    """Call func(*args), capturing what it prints.
+
+    :return: A tuple (result, output, error), where result is None and
+        error the formatted traceback if func raised an exception, and error
+        is None otherwise.
+    """
+    output = io.StringIO()
+    result = error = None
+    with contextlib.redirect_stdout(output):
+        try:
+            result = func(*args)
+        except Exception:
+            error = traceback.format_exc()
+    return result, output.getvalue(), error
@@ -0,0 +1,62 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Dependency metadata read from a directory of wheels."""
+
+import collections
+import email.parser
+import os
+import zipfile
+
+import packaging.utils
+
+
+Wheel = collections.namedtuple(
+    'Wheel', ['name', 'version', 'requires', 'filename'])
+
+
+def read_wheel(path):
+    """Read the core metadata of the wheel at path.
+
+    :return: A Wheel. requires holds the raw Requires-Dist strings.
+    """
+    with zipfile.ZipFile(path) as whl:
+        names = [n for n in whl.namelist()
+                 if n.count('/') == 1 and
+                 n.endswith('.dist-info/METADATA')]
+        if len(names) != 1:
+            raise Exception("No single METADATA in wheel %s" % path)
+        text = whl.read(names[0]).decode('utf-8')
+    metadata = email.parser.HeaderParser().parsestr(text)
+    return Wheel(
+        metadata['Name'], metadata['Version'],
+        tuple(metadata.get_all('Requires-Dist') or ()),
+        os.path.basename(path))
+
+
+def read_wheelhouse(wheelhouse):
+    """Read the metadata of every wheel in wheelhouse.
+
+    :return: A dict of canonical package name to the list of Wheels for it,
+        one per version and platform present.
+    """
+    wheels = collections.defaultdict(list)
+    try:
+        filenames = sorted(os.listdir(wheelhouse))
+    except FileNotFoundError:
+        filenames = []
+    for filename in filenames:
+        if not filename.endswith('.whl'):
+            continue
+        wheel = read_wheel(os.path.join(wheelhouse, filename))
+        wheels[packaging.utils.canonicalize_name(wheel.name)].append(wheel)
+    return dict(wheels)
@@ -16,7 +16,9 @@
 import argparse
 import re
 
-import pkg_resources
+import packaging.requirements
+
+from openstack_requirements import requirement
 
 overrides = dict()
 # List of overrides needed. Ignore version in pip-freeze and use the one here
@@ -27,6 +29,11 @@ overrides = dict()
 # overrides['libvirt-python'] = None
 
 
+def _parse(line):
+    """Parse a requirement line, ignoring any trailing comment."""
+    return packaging.requirements.Requirement(line.partition(' #')[0].strip())
+
+
 def cap(requirements, frozen):
     """Cap requirements to version in freeze.
 
@@ -38,7 +45,7 @@ def cap(requirements, frozen):
     output = []
     for line in requirements:
         try:
-            req = pkg_resources.Requirement.parse(line)
+            req = _parse(line)
             specifier = str(req.specifier)
             if any(op in specifier for op in ['==', '~=', '<']):
                 # if already capped, continue
@@ -48,15 +55,16 @@ def cap(requirements, frozen):
             # line was a comment, continue
             output.append(line)
             continue
-        if req.project_name in overrides:
-            new_line = overrides[req.project_name]
+        name = requirement.safe_name(req.name)
+        if name in overrides:
+            new_line = overrides[name]
             if new_line:
-                output.append(overrides[req.project_name])
+                output.append(overrides[name])
             else:
                 output.append(line)
             continue
         # add cap
-        new_cap = cap_requirement(req.project_name, frozen)
+        new_cap = cap_requirement(name, frozen)
         if new_cap:
             output.append(pin(line, new_cap))
         else:
@@ -67,7 +75,7 @@ def cap(requirements, frozen):
 def pin(line, new_cap):
     """Add new cap into existing line
 
-    Don't use pkg_resources so we can preserve the comments.
+    Don't use packaging so we can preserve the comments.
     """
     end = None
     use_comma = False
@@ -103,14 +111,14 @@ def cap_requirement(requirement, frozen):
 def freeze(lines):
     """Parse lines from freeze file into a dict.
 
-    Where k:v is project_name:specifier.
+    Where k:v is safe_name(name):specifier.
     """
     freeze = dict()
 
     for line in lines:
         try:
-            req = pkg_resources.Requirement.parse(line)
-            freeze[req.project_name] = req.specifier
+            req = _parse(line)
+            freeze[requirement.safe_name(req.name)] = req.specifier
         except ValueError:
             # not a valid requirement, can be a comment, blank line etc
             continue